@@ -1,11 +1,297 @@
-from fastapi import FastAPI, File, UploadFile, Form
+from fastapi import FastAPI, File, UploadFile, Form, Query, HTTPException, Header, Request, Response
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
+from typing import List, Optional
+import asyncio
+import contextvars
+import copy
 import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from scripts.parse_paystub import extract_fields_from_pdf
-import tempfile
-from scripts.evaluate_income import run_assistant
+from scripts.applications import discover_folders, resolve_folder, load_application
+from scripts import pdf_engine, metrics
+from scripts.pdf_text import page_cache, pdf_digest
+from scripts.result_cache import cache_key
+from scripts.job_queue import JobQueue, JobFailed, run_worker
+from scripts.evaluate_income import run_assistant_async, stream_assistant, result_cache
 app = FastAPI()
 
+# PDF parsing is CPU-bound, so it runs on a bounded pool instead of the event loop
+PDF_PARSE_WORKERS = int(os.getenv("PDF_PARSE_WORKERS", "4"))
+# Upper bound on underwrites being processed at once by this worker; extra requests wait their turn
+MAX_IN_FLIGHT_UNDERWRITES = int(os.getenv("MAX_IN_FLIGHT_UNDERWRITES", "32"))
+# Default and maximum number of items of a single batch that run at the same time
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+MAX_BATCH_CONCURRENCY = int(os.getenv("MAX_BATCH_CONCURRENCY", "32"))
+# Manifest folders are resolved relative to this directory and may not escape it
+BATCH_DATA_ROOT = os.getenv("BATCH_DATA_ROOT", "data")
+# Durable queue behind POST /jobs. Workers run in this process (JOB_WORKERS, 0 for
+# none) and/or as separate processes started with scripts/job_worker.py.
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", ".cache/jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+# Finished jobs are deleted after this long; 0 keeps them
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", str(7 * 24 * 3600)))
+# The form parser spools every upload before a route sees it, so the request body
+# itself is capped at MAX_REQUEST_BYTES (a whole batch) while it streams in, chunked
+# or not; one announcing more in its Content-Length is refused before it's read.
+# Each upload is then read back in chunks and rejected once it passes
+# MAX_UPLOAD_BYTES or turns out not to be a PDF.
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+MAX_REQUEST_BYTES = int(os.getenv("MAX_REQUEST_BYTES", str(128 * 1024 * 1024)))
+# PDF readers accept the header anywhere in the first 1024 bytes
+PDF_MAGIC = b"%PDF-"
+PDF_HEADER_WINDOW = 1024
+
+pdf_executor = ThreadPoolExecutor(max_workers=PDF_PARSE_WORKERS, thread_name_prefix="pdf-parse")
+in_flight = asyncio.Semaphore(MAX_IN_FLIGHT_UNDERWRITES)
+job_queue = JobQueue(
+    JOB_QUEUE_PATH,
+    lease_seconds=JOB_LEASE_SECONDS,
+    max_attempts=JOB_MAX_ATTEMPTS,
+    retention_seconds=JOB_RETENTION_SECONDS or None
+)
+job_workers = []
+# Underwrites being evaluated right now, by a hash of their inputs; identical
+# requests arriving meanwhile wait for the same evaluation instead of starting their own
+running_underwrites = {}
+
+
+async def parse_pdf(parse, pdf):
+    """Run parse(pdf) on the PDF pool, timed as the pdf_parse stage."""
+    loop = asyncio.get_running_loop()
+    # Run in a copy of this context so stages timed in the worker thread reach the request's Server-Timing
+    context = contextvars.copy_context()
+    try:
+        with metrics.stage("pdf_parse"):
+            return await loop.run_in_executor(pdf_executor, context.run, parse, pdf)
+    except Exception as e:
+        metrics.record_error("pdf_parse", e)
+        raise
+
+
+def check_pdf_header(filename, head):
+    if PDF_MAGIC not in head[:PDF_HEADER_WINDOW]:
+        raise HTTPException(status_code=415, detail=f"{filename} is not a PDF")
+
+
+async def read_upload(file):
+    """Bytes of an uploaded PDF, read in chunks of UPLOAD_CHUNK_BYTES.
+
+    The upload has already been received and spooled by the form parser (the
+    request body as a whole is bounded by LimitRequestSize); this bounds what
+    is held in memory per file. Raises 415 as soon as the first chunk shows the
+    file isn't a PDF and 413 once it grows past MAX_UPLOAD_BYTES. The spooled
+    copy is closed (and its spill file, if any, removed) before returning.
+    """
+    buffer = bytearray()
+    try:
+        with metrics.stage("upload_read"):
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                buffer += chunk
+                metrics.UPLOAD_BYTES.inc(len(chunk))
+                if len(buffer) > MAX_UPLOAD_BYTES:
+                    raise HTTPException(status_code=413, detail=f"{file.filename} is larger than {MAX_UPLOAD_BYTES} bytes")
+                # Check the header once enough of it has arrived, without waiting for the rest
+                if len(buffer) - len(chunk) < PDF_HEADER_WINDOW <= len(buffer):
+                    check_pdf_header(file.filename, buffer)
+    finally:
+        await file.close()
+    if len(buffer) < PDF_HEADER_WINDOW:
+        check_pdf_header(file.filename, buffer)
+    return bytes(buffer)
+
+
+def underwrite_key(pdf, borrower_data):
+    if isinstance(pdf, bytes):
+        pdf = pdf_digest(pdf)
+    return cache_key("underwrite", pdf, borrower_data)
+
+
+async def underwrite_one(pdf, borrower_data):
+    """Parse a paystub (uploaded bytes or a path on disk) and evaluate it.
+
+    pdf may also be paystub data extracted ahead of time (a dict), which is
+    evaluated as is. Concurrent calls with the same paystub and borrower data
+    share a single evaluation and each get a copy of its result. The
+    evaluation is cancelled only once every caller waiting on it has gone.
+    """
+    key = underwrite_key(pdf, borrower_data)
+    flight = running_underwrites.get(key)
+    if flight is None:
+        flight = {"task": asyncio.ensure_future(evaluate_underwrite(pdf, borrower_data)), "waiters": 0}
+        running_underwrites[key] = flight
+        flight["task"].add_done_callback(lambda _, flight=flight: running_underwrites.get(key) is flight and running_underwrites.pop(key))
+    else:
+        metrics.COALESCED_UNDERWRITES.inc()
+    flight["waiters"] += 1
+    try:
+        # Shielded so one caller going away doesn't cancel the result for the others
+        return copy.deepcopy(await asyncio.shield(flight["task"]))
+    finally:
+        flight["waiters"] -= 1
+        if not flight["waiters"] and not flight["task"].done():
+            # Unlisted right away: the task only finishes cancelling later, and a
+            # request arriving meanwhile must start its own flight rather than join this one
+            if running_underwrites.get(key) is flight:
+                del running_underwrites[key]
+            flight["task"].cancel()
+
+
+async def evaluate_underwrite(pdf, borrower_data):
+    async with in_flight:
+        if isinstance(pdf, dict):
+            return await run_assistant_async(pdf, borrower_data)
+        paystub_data = await parse_pdf(extract_fields_from_pdf, pdf)
+        return await run_assistant_async(paystub_data, borrower_data)
+
+
+async def underwrite_job(job):
+    result = await underwrite_one(job["pdf"], job["borrower_data"])
+    # Model errors come back as a result without an income; retry those
+    if result.get("qualifying_income_monthly") is None:
+        message = result["action_items"][0] if result.get("action_items") else "No qualifying income"
+        raise JobFailed(message, result)
+    return result
+
+
+def manifest_items(manifest):
+    """Turn a batch manifest into (name, paystub, borrower data) items.
+
+    The manifest is {"folders": ["naga", "ravi", ...]} with folders laid out like
+    data/<name>/document_1.pdf + metadata.json. Without "folders", every application
+    folder under BATCH_DATA_ROOT is included. The paystub is the path of the first
+    document, or its fields from an up-to-date extracted.json, which skips parsing.
+    """
+    if "folders" in manifest:
+        folders = [resolve_folder(BATCH_DATA_ROOT, folder) for folder in manifest["folders"]]
+    else:
+        folders = discover_folders(BATCH_DATA_ROOT)
+
+    items = []
+    for folder in folders:
+        application = load_application(folder)
+        if not application["documents"]:
+            raise ValueError(f"Folder {application['name']!r} has no PDF documents")
+        paystub = application["extracted"][0]["paystub"] if application["extracted"] else application["documents"][0]
+        items.append((application["name"], paystub, application["borrower_data"]))
+    return items
+
+
+async def stream_batch(items, concurrency):
+    """Run items with at most `concurrency` in flight, yielding NDJSON lines as each finishes."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(index, name, pdf, borrower_data):
+        async with semaphore:
+            try:
+                result = await underwrite_one(pdf, borrower_data)
+                return {"index": index, "name": name, "status": "ok", "result": result}
+            except Exception as e:
+                return {"index": index, "name": name, "status": "error", "error": str(e)}
+
+    tasks = [asyncio.create_task(run(index, *item)) for index, item in enumerate(items)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield json.dumps(await next_done) + "\n"
+    finally:
+        # Client went away or the stream was closed early; don't keep paying for LLM calls
+        for task in tasks:
+            task.cancel()
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def stream_underwrite(filename, contents, borrower_data):
+    """Server-Sent Events for each stage of one underwrite."""
+    yield sse("upload_received", {"filename": filename, "bytes": len(contents)})
+    async with in_flight:
+        try:
+            paystub_data = await parse_pdf(extract_fields_from_pdf, contents)
+        except Exception as e:
+            yield sse("error", {"stage": "pdf_parsed", "error": str(e)})
+            return
+        fields = {key: value for key, value in paystub_data.items() if key != "raw_text"}
+        yield sse("pdf_parsed", {"fields": fields})
+        async for event, data in stream_assistant(paystub_data, borrower_data):
+            yield sse(event, data)
+
+
+class LimitRequestSize:
+    """ASGI middleware refusing request bodies over max_bytes with 413.
+
+    A Content-Length over the limit is refused before anything is read. Other
+    bodies, chunked ones included, are counted as they are received and the
+    request fails as soon as it passes the limit, so the form parser never
+    spools more than max_bytes.
+    """
+
+    def __init__(self, app, max_bytes):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        detail = f"Request body is larger than {self.max_bytes} bytes"
+        length = dict(scope["headers"]).get(b"content-length", b"")
+        if length.isdigit() and int(length) > self.max_bytes:
+            return await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # Raised while the route reads its body, and answered like any HTTPException
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+app.add_middleware(LimitRequestSize, max_bytes=MAX_REQUEST_BYTES)
+
+
+@app.middleware("http")
+async def instrument(request: Request, call_next):
+    """Count and time every request, and report its pipeline stages in a Server-Timing header."""
+    timings = metrics.start_request()
+    started = time.perf_counter()
+    response = await call_next(request)
+    seconds = time.perf_counter() - started
+    # The route template rather than the raw path, so /jobs/{job_id} is one series
+    route = request.scope.get("route")
+    path = route.path if route is not None else "unmatched"
+    metrics.HTTP_REQUESTS.inc(route=path, method=request.method, status=str(response.status_code))
+    metrics.HTTP_SECONDS.observe(seconds, route=path)
+    timings["total"] = seconds
+    response.headers["Server-Timing"] = metrics.server_timing(timings)
+    return response
+
+
+@app.on_event("startup")
+async def start_job_workers():
+    for _ in range(JOB_WORKERS):
+        job_workers.append(asyncio.create_task(run_worker(job_queue, underwrite_job)))
+
+
+@app.on_event("shutdown")
+def shutdown_executor():
+    for task in job_workers:
+        task.cancel()
+    pdf_executor.shutdown(wait=False, cancel_futures=True)
+    pdf_engine.shutdown()
 
 
 @app.post("/underwrite/")
@@ -13,11 +299,113 @@ async def underwrite(
     file: UploadFile = File(...),
     borrower_json: str = Form(...)
 ):
-    temp = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-    temp.write(await file.read())
-    temp.close()
+    borrower_data = json.loads(borrower_json)
+    contents = await read_upload(file)
+    return await underwrite_one(contents, borrower_data)
+
+
+@app.post("/underwrite/stream")
+async def underwrite_stream(
+    file: UploadFile = File(...),
+    borrower_json: str = Form(...)
+):
+    """Same as /underwrite/, streamed as Server-Sent Events.
 
-    paystub_data = extract_fields_from_pdf(temp.name)
+    Events: upload_received, pdf_parsed (extracted fields), llm_started, delta
+    (tool call argument fragments), income (as soon as the figure is known) and
+    result (the final underwrite_income payload).
+    """
     borrower_data = json.loads(borrower_json)
-    result = run_assistant(paystub_data, borrower_data)
-    return result
+    contents = await read_upload(file)
+    return StreamingResponse(
+        stream_underwrite(file.filename, contents, borrower_data),
+        media_type="text/event-stream",
+        # Keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/underwrite/batch")
+async def underwrite_batch(
+    files: Optional[List[UploadFile]] = File(None),
+    borrower_jsons: Optional[List[str]] = Form(None),
+    manifest: Optional[str] = Form(None),
+    concurrency: Optional[int] = Query(None, ge=1)
+):
+    """Underwrite many borrowers at once and stream one JSON line per result as it completes.
+
+    Send either pairs of `files` + `borrower_jsons` (matched by position), or a
+    `manifest` naming application folders (see manifest_items).
+    """
+    items = []
+    if files or borrower_jsons:
+        if len(files or []) != len(borrower_jsons or []):
+            raise HTTPException(status_code=422, detail="files and borrower_jsons must have the same length")
+        for file, borrower_json in zip(files, borrower_jsons):
+            try:
+                borrower_data = json.loads(borrower_json)
+            except json.JSONDecodeError as e:
+                raise HTTPException(status_code=422, detail=f"Invalid borrower JSON for {file.filename}: {e}")
+            # Uploads are read now because the form is closed once the handler returns
+            items.append((file.filename, await read_upload(file), borrower_data))
+    if manifest:
+        try:
+            # Reads and hashes every PDF of the manifest's folders; off the event loop
+            items.extend(await asyncio.to_thread(manifest_items, json.loads(manifest)))
+        except (ValueError, OSError) as e:
+            raise HTTPException(status_code=422, detail=f"Invalid manifest: {e}")
+    if not items:
+        raise HTTPException(status_code=422, detail="Provide files with borrower_jsons, or a manifest")
+
+    concurrency = min(concurrency or BATCH_CONCURRENCY, MAX_BATCH_CONCURRENCY)
+    return StreamingResponse(stream_batch(items, concurrency), media_type="application/x-ndjson")
+
+
+@app.post("/jobs", status_code=202)
+async def submit_job(
+    response: Response,
+    file: UploadFile = File(...),
+    borrower_json: str = Form(...),
+    idempotency_key: Optional[str] = Header(None)
+):
+    """Queue an underwrite and return its job id straight away; poll GET /jobs/{id} for the result.
+
+    Re-sending a request with the same Idempotency-Key header returns the
+    original job instead of queueing another one.
+    """
+    try:
+        borrower_data = json.loads(borrower_json)
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid borrower JSON: {e}")
+    contents = await read_upload(file)
+    job_id, created = await asyncio.to_thread(job_queue.enqueue, contents, borrower_data, file.filename, idempotency_key)
+    if not created:
+        response.status_code = 200
+    response.headers["Location"] = f"/jobs/{job_id}"
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    return {"job_id": job_id, "status": job["status"]}
+
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """Status of a queued underwrite: queued, running, succeeded or failed, with its result or error."""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Counters and latency histograms in the Prometheus text format."""
+    metrics.record_cache("result", result_cache)
+    metrics.record_cache("page_text", page_cache)
+    for status, count in job_queue.counts().items():
+        metrics.JOBS.set(count, status=status)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Hit/miss counters of the run_assistant result cache, with the seconds and tokens saved by hits."""
+    return result_cache.stats()
@@ -0,0 +1,32 @@
+import argparse
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.pdf_text import extract_text
+from scripts.field_extraction import extract_fields
+from benchmarks.common import ROOT, PAYSTUBS as FIXTURES
+
+
+def main(iterations):
+    texts = {os.path.relpath(path, ROOT): extract_text(path) for path in FIXTURES}
+
+    for name, text in texts.items():
+        fields, _ = extract_fields(text)
+        print(f"{name}: {len(fields)} fields ({', '.join(sorted(fields))})")
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for text in texts.values():
+            extract_fields(text)
+    elapsed = time.perf_counter() - started
+
+    stubs = iterations * len(texts)
+    print(f"\n{stubs} stubs in {elapsed:.3f}s: {stubs / elapsed:,.0f} stubs/s, {elapsed / stubs * 1e6:.1f} us/stub")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmark paystub field extraction over the sample PDFs")
+    parser.add_argument("--iterations", type=int, default=2000, help="Passes over the fixtures")
+    args = parser.parse_args()
+    main(args.iterations)
@@ -0,0 +1,96 @@
+import argparse
+import io
+import os
+import sys
+import pypdfium2 as pdfium
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Measure the work itself, not the on-disk caches left by earlier runs
+os.environ.setdefault("PAGE_TEXT_CACHE_PATH", "")
+from benchmarks.common import ROOT, PAYSTUBS, measure, print_results, save_baseline, compare_baseline
+from scripts.pdf_text import read_pdf, page_cache
+from scripts.parse_paystub import BACKENDS, PDF_BACKENDS, extract_fields_from_pdf, scan_pages, paystub_fields, missing_fields
+
+BASELINE = "pdf_backends"
+# Filler pages for the bundle case, standing in for W-2s and statements uploaded with a paystub
+FILLER_PDF = os.path.join(ROOT, "docs", "fannie-mae.pdf")
+# Fields compared between backends; the rest (confidence, raw_text) differ by nature
+COMPARED_FIELDS = (
+    "gross_pay_per_period", "ytd_income", "net_pay", "hours", "rate", "pay_frequency",
+    "pay_period_start", "pay_period_end", "pay_date", "employer_name"
+)
+
+
+def uncached(fn, data):
+    # The layout backend goes through the page text cache; time the parsing itself
+    def run():
+        page_cache.clear()
+        return fn(data)
+    return run
+
+
+def bundle(paystub, filler_pages):
+    """A PDF of the paystub followed by the first filler_pages pages of FILLER_PDF."""
+    document = pdfium.PdfDocument.new()
+    document.import_pages(pdfium.PdfDocument(paystub))
+    document.import_pages(pdfium.PdfDocument(FILLER_PDF), list(range(filler_pages)))
+    output = io.BytesIO()
+    document.save(output)
+    return output.getvalue()
+
+
+def run(iterations, filler_pages):
+    documents = [(os.path.relpath(path, ROOT), read_pdf(path)) for path in PAYSTUBS]
+    results = {}
+    accuracy = []
+    for name, data in documents:
+        extracted = {}
+        for backend, fn in BACKENDS.items():
+            results[f"{backend}[{name}]"] = measure(uncached(lambda data: scan_pages(fn(data)), data), iterations)
+            extracted[backend] = scan_pages(fn(data))
+        results[f"auto[{name}]"] = measure(uncached(extract_fields_from_pdf, data), iterations)
+        served = extract_fields_from_pdf(data)["backend"]
+
+        # Layout analysis is the reference the other backends are scored against
+        reference = extracted["layout"]
+        for backend, fields in extracted.items():
+            agree = sum(fields[field] == reference[field] for field in COMPARED_FIELDS)
+            accuracy.append((name, backend, len(missing_fields(fields)), agree, served == backend))
+
+    # A paystub with pages after it: scanning stops at page 1, reading everything doesn't
+    if filler_pages and os.path.exists(FILLER_PDF):
+        data = bundle(documents[0][1], filler_pages)
+        name = f"{documents[0][0]}+{filler_pages}"
+        slow_iterations = max(1, iterations // 5)
+        for backend, fn in BACKENDS.items():
+            results[f"{backend}_scan[{name}]"] = measure(uncached(lambda data: scan_pages(fn(data)), data), iterations)
+            results[f"{backend}_all_pages[{name}]"] = measure(
+                uncached(lambda data: paystub_fields("\n".join(fn(data))), data), slow_iterations, warmup=0
+            )
+    return results, accuracy
+
+
+def print_accuracy(accuracy):
+    width = max(len(name) for name, *_ in accuracy)
+    print(f"\n{'document':<{width}}  {'backend':<8}  {'missing':>7}  {'agree':>7}  served")
+    for name, backend, missing, agree, served in accuracy:
+        print(f"{name:<{width}}  {backend:<8}  {missing:>7}  {agree:>3}/{len(COMPARED_FIELDS):<3}  {'yes' if served else ''}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the latency and field accuracy of the PDF backends over the sample PDFs")
+    parser.add_argument("--iterations", type=int, default=20, help="Timed calls per case")
+    parser.add_argument("--filler-pages", type=int, default=20, help="Pages after the paystub in the bundle case; 0 skips it")
+    parser.add_argument("--save-baseline", action="store_true", help=f"Save the results as benchmarks/baselines/{BASELINE}.json")
+    parser.add_argument("--compare", action="store_true", help="Compare with the saved baseline and exit with status 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p50 slowdown before a case counts as a regression")
+    args = parser.parse_args()
+
+    print(f"Backends tried in order: {', '.join(PDF_BACKENDS)}\n")
+    results, accuracy = run(args.iterations, args.filler_pages)
+    print_results(results)
+    print_accuracy(accuracy)
+    print("\nmissing: required fields not found; agree: fields equal to the layout backend's; served: used by extract_fields_from_pdf")
+    if args.save_baseline:
+        save_baseline(BASELINE, results, {"iterations": args.iterations, "filler_pages": args.filler_pages})
+    if args.compare and compare_baseline(BASELINE, results, metric="p50_ms", tolerance=args.tolerance):
+        sys.exit(1)
@@ -0,0 +1,50 @@
+import argparse
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Measure the work itself, not the on-disk caches left by earlier runs
+os.environ.setdefault("PAGE_TEXT_CACHE_PATH", "")
+from benchmarks.common import ROOT, PAYSTUBS, load_borrower, measure, print_results, save_baseline, compare_baseline
+from scripts.pdf_engine import extract_pages
+from scripts.pdf_text import extract_page_texts, read_pdf
+from scripts.parse_paystub import extract_fields_from_pdf
+from scripts.prompt_builder import build_prompt
+from scripts.guideline_index import GuidelineIndex, build_query
+from scripts.evaluate_income import GUIDELINE_INDEX_PATH, GUIDELINE_TOP_K
+
+BASELINE = "pipeline"
+
+
+def run(iterations):
+    documents = [(os.path.relpath(path, ROOT), path, read_pdf(path)) for path in PAYSTUBS]
+    guideline_index = GuidelineIndex(GUIDELINE_INDEX_PATH) if os.path.exists(GUIDELINE_INDEX_PATH) else None
+
+    results = {}
+    for name, path, data in documents:
+        # Layout analysis of every page, bypassing the page text cache
+        results[f"pdf_text_uncached[{name}]"] = measure(lambda: extract_pages([(data, None)]), iterations)
+        results[f"pdf_text_cached[{name}]"] = measure(lambda: extract_page_texts(data), iterations)
+        # The fast text backend, with the layout backend only if it misses fields
+        results[f"extract_fields_from_pdf[{name}]"] = measure(lambda: extract_fields_from_pdf(path), iterations)
+
+        paystub_data = extract_fields_from_pdf(path)
+        borrower_data = load_borrower(path)
+        guidelines = guideline_index.search(build_query(paystub_data, borrower_data), k=GUIDELINE_TOP_K) if guideline_index else []
+        results[f"build_prompt[{name}]"] = measure(lambda: build_prompt(paystub_data, borrower_data, guidelines), iterations)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmark PDF text extraction, field extraction and prompt construction over the sample PDFs")
+    parser.add_argument("--iterations", type=int, default=50, help="Timed calls per case")
+    parser.add_argument("--save-baseline", action="store_true", help=f"Save the results as benchmarks/baselines/{BASELINE}.json")
+    parser.add_argument("--compare", action="store_true", help="Compare with the saved baseline and exit with status 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p50 slowdown before a case counts as a regression")
+    args = parser.parse_args()
+
+    results = run(args.iterations)
+    print_results(results)
+    if args.save_baseline:
+        save_baseline(BASELINE, results, {"iterations": args.iterations})
+    if args.compare and compare_baseline(BASELINE, results, metric="p50_ms", tolerance=args.tolerance):
+        sys.exit(1)
@@ -0,0 +1,165 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import uvicorn
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Checks the retries and client-side rate limits of scripts/llm_client.py against
+# the mock server in benchmarks/mock_openai.py, started in this process on a free
+# port. Exits with status 1 when a check fails.
+STATE_DIR = tempfile.mkdtemp(prefix="check_llm_client_")
+RATE_LIMIT_PATH = os.path.join(STATE_DIR, "rate_limit.sqlite3")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+PORT = free_port()
+os.environ.update(
+    OPENAI_API_KEY="test",
+    OPENAI_BASE_URL=f"http://127.0.0.1:{PORT}/v1",
+    OPENAI_MAX_RETRIES="2",
+    OPENAI_BACKOFF_BASE="0.05",
+    OPENAI_RPM_LIMIT="0",
+    OPENAI_TPM_LIMIT="0",
+    OPENAI_MAX_THROTTLE_WAIT="1"
+)
+from benchmarks import mock_openai
+from scripts import llm_client, metrics
+from scripts.llm_client import RateLimiter, ThrottledError, chat_completion, chat_completion_async
+
+MESSAGES = [{"role": "user", "content": "Underwrite this paystub."}]
+
+
+def start_mock():
+    server = uvicorn.Server(uvicorn.Config(mock_openai.app, host="127.0.0.1", port=PORT, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    mock_openai.SETTINGS.update(latency=0.0, jitter=0.0, error_rate=0.0)
+    return server
+
+
+def reset(fail_next=0, limiter=None):
+    mock_openai.SETTINGS["fail_next"] = fail_next
+    mock_openai.STATS.update(ok=0, rate_limited=0)
+    llm_client.rate_limiter = limiter or RateLimiter({})
+
+
+def retries():
+    return sum(metrics.LLM_RETRIES._values.values())
+
+
+def check_retry_after_429():
+    reset(fail_next=2)
+    before = retries()
+    started = time.perf_counter()
+    response = chat_completion(model="mock", messages=MESSAGES)
+    elapsed = time.perf_counter() - started
+    assert response.choices[0].message.tool_calls, "no tool call in the answer"
+    assert mock_openai.STATS == {"ok": 1, "rate_limited": 2}, mock_openai.STATS
+    assert retries() - before == 2, f"{retries() - before} retries counted"
+    # The mock sends retry-after-ms: 200, which has to be honoured on both retries
+    assert elapsed >= 0.4, f"retried after {elapsed:.2f}s, sooner than Retry-After"
+
+
+def check_gives_up_after_max_retries():
+    reset(fail_next=10)
+    try:
+        chat_completion(model="mock", messages=MESSAGES)
+    except llm_client.openai.RateLimitError:
+        pass
+    else:
+        raise AssertionError("succeeded although every attempt was rate limited")
+    assert mock_openai.STATS["rate_limited"] == llm_client.OPENAI_MAX_RETRIES + 1, mock_openai.STATS
+
+
+def check_async_retry():
+    reset(fail_next=1)
+    response = asyncio.run(chat_completion_async(model="mock", messages=MESSAGES))
+    assert response.choices[0].message.tool_calls, "no tool call in the answer"
+    assert mock_openai.STATS == {"ok": 1, "rate_limited": 1}, mock_openai.STATS
+
+
+def check_throttle_spaces_requests():
+    # 60 requests per minute with the minute's budget used up: one request per second
+    reset(limiter=RateLimiter({"requests": 60}))
+    llm_client.rate_limiter.reserve({"requests": 60})
+    started = time.perf_counter()
+    for _ in range(2):
+        chat_completion(model="mock", messages=MESSAGES)
+    elapsed = time.perf_counter() - started
+    assert mock_openai.STATS["ok"] == 2, mock_openai.STATS
+    assert 1.9 <= elapsed < 3.0, f"2 requests took {elapsed:.2f}s, expected about 2s"
+
+
+def check_throttle_wait_is_bounded():
+    # 6 requests per minute: after 6, the next slot is 10s away, over OPENAI_MAX_THROTTLE_WAIT
+    reset(limiter=RateLimiter({"requests": 6}))
+    for _ in range(6):
+        chat_completion(model="mock", messages=MESSAGES)
+    started = time.perf_counter()
+    try:
+        chat_completion(model="mock", messages=MESSAGES)
+    except ThrottledError:
+        pass
+    else:
+        raise AssertionError("request sent although the limit was used up")
+    assert time.perf_counter() - started < 0.5, "waited before giving up"
+    assert mock_openai.STATS["ok"] == 6, mock_openai.STATS
+    # Giving up takes nothing from the budget
+    assert llm_client.rate_limiter.reserve({"requests": 1}, max_wait=11) < 11
+
+
+def use_shared_budget(path, count):
+    limiter = RateLimiter({"requests": 6}, path)
+    for _ in range(count):
+        limiter.reserve({"requests": 1})
+
+
+def check_budget_shared_across_processes():
+    process = multiprocessing.get_context("spawn").Process(target=use_shared_budget, args=(RATE_LIMIT_PATH, 6))
+    process.start()
+    process.join()
+    assert process.exitcode == 0, f"worker process exited with {process.exitcode}"
+    # The other process used the whole budget; this one has to wait for it to refill
+    wait = RateLimiter({"requests": 6}, RATE_LIMIT_PATH).reserve({"requests": 1})
+    assert 9 <= wait <= 10, f"waiting {wait:.2f}s, expected about 10s"
+
+
+CHECKS = [
+    check_retry_after_429,
+    check_gives_up_after_max_retries,
+    check_async_retry,
+    check_throttle_spaces_requests,
+    check_throttle_wait_is_bounded,
+    check_budget_shared_across_processes
+]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the retries and rate limits of the OpenAI client against the mock server")
+    parser.add_argument("checks", nargs="*", help="Names of the checks to run; default all")
+    args = parser.parse_args()
+
+    start_mock()
+    failures = 0
+    for check in CHECKS:
+        if args.checks and check.__name__ not in args.checks:
+            continue
+        try:
+            check()
+            print(f"ok    {check.__name__}")
+        except Exception as e:
+            failures += 1
+            print(f"FAIL  {check.__name__}: {e.__class__.__name__}: {e}")
+    sys.exit(1 if failures else 0)
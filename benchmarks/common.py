@@ -0,0 +1,111 @@
+import glob
+import json
+import math
+import os
+import platform
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_DIR = os.path.join(ROOT, "benchmarks", "baselines")
+
+# Paystub fixtures; the Fannie Mae guide is not a paystub and would dominate the timings
+PAYSTUBS = sorted(glob.glob(os.path.join(ROOT, "docs", "*paystub*.pdf")) + glob.glob(os.path.join(ROOT, "data", "*", "*.pdf")))
+
+
+def load_borrower(pdf_path):
+    """The metadata.json next to a data/<name>/ document, or data/jane.json for the docs/ samples."""
+    path = os.path.join(os.path.dirname(pdf_path), "metadata.json")
+    if not os.path.exists(path):
+        path = os.path.join(ROOT, "data", "jane.json")
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def percentile(sorted_samples, fraction):
+    """Nearest-rank percentile of already sorted samples."""
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, max(0, math.ceil(fraction * len(sorted_samples)) - 1))
+    return sorted_samples[index]
+
+
+def summarize(samples, elapsed=None):
+    """Latency percentiles in milliseconds and throughput for per-operation samples in seconds.
+
+    elapsed is the wall-clock time of the whole run; without it throughput is
+    derived from the summed samples (i.e. for sequential runs).
+    """
+    samples = sorted(samples)
+    elapsed = elapsed if elapsed is not None else sum(samples)
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(samples, 0.99) * 1000, 3),
+        "mean_ms": round(sum(samples) / len(samples) * 1000, 3) if samples else 0.0,
+        "per_second": round(len(samples) / elapsed, 2) if elapsed else 0.0
+    }
+
+
+def measure(fn, iterations, warmup=1):
+    """Time `iterations` sequential calls of fn after `warmup` untimed ones."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+def print_results(results):
+    width = max(len(name) for name in results)
+    print(f"{'case':<{width}}  {'count':>7}  {'p50 ms':>10}  {'p95 ms':>10}  {'p99 ms':>10}  {'per s':>10}")
+    for name, stats in results.items():
+        print(
+            f"{name:<{width}}  {stats['count']:>7}  {stats['p50_ms']:>10.3f}  {stats['p95_ms']:>10.3f}  "
+            f"{stats['p99_ms']:>10.3f}  {stats['per_second']:>10.2f}"
+        )
+
+
+def baseline_path(name):
+    return os.path.join(BASELINE_DIR, f"{name}.json")
+
+
+def save_baseline(name, results, settings=None):
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    path = baseline_path(name)
+    with open(path, "w") as f:
+        json.dump({
+            "saved_at": datetime.now().isoformat(),
+            "machine": platform.node(),
+            "python": platform.python_version(),
+            "settings": settings or {},
+            "results": results
+        }, f, indent=2)
+    print(f"\nBaseline saved to {os.path.relpath(path, ROOT)}")
+
+
+def compare_baseline(name, results, metric="p95_ms", tolerance=0.2):
+    """Print how results compare with the saved baseline; returns the cases that got slower than tolerance allows."""
+    path = baseline_path(name)
+    if not os.path.exists(path):
+        print(f"\nNo baseline at {os.path.relpath(path, ROOT)}; run with --save-baseline first")
+        return []
+    with open(path, "r") as f:
+        baseline = json.load(f)["results"]
+
+    print(f"\nCompared with baseline ({metric}, tolerance {tolerance:.0%}):")
+    regressions = []
+    for case, stats in results.items():
+        if case not in baseline or not baseline[case][metric]:
+            continue
+        before, after = baseline[case][metric], stats[metric]
+        change = (after - before) / before
+        flag = "REGRESSION" if change > tolerance else "ok"
+        print(f"  {case}: {before:.3f} -> {after:.3f} ({change:+.1%}) {flag}")
+        if change > tolerance:
+            regressions.append(case)
+    return regressions
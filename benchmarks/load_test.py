@@ -0,0 +1,139 @@
+import argparse
+import itertools
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+import requests
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.common import ROOT, PAYSTUBS, load_borrower, summarize, print_results, save_baseline, compare_baseline
+from scripts.parse_paystub import extract_fields_from_pdf
+from scripts.rules_engine import evaluate_salaried
+
+BASELINE = "load_test"
+EVALUATIONS = re.compile(r'^underwriter_evaluations_total\{path="(\w+)"\} (\S+)$', re.MULTILINE)
+
+_local = threading.local()
+
+
+def session():
+    # One keep-alive connection per worker thread
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+
+def send(url, fixture, unique, timeout):
+    name, data, borrower_data = fixture
+    if unique:
+        # A distinct borrower per request defeats the result cache, so every request does the full work
+        borrower_data = {**borrower_data, "load_test_id": uuid.uuid4().hex}
+    started = time.perf_counter()
+    try:
+        response = session().post(
+            url,
+            files={"file": (os.path.basename(name), data, "application/pdf")},
+            data={"borrower_json": json.dumps(borrower_data)},
+            timeout=timeout
+        )
+        seconds = time.perf_counter() - started
+        if response.status_code != 200:
+            return seconds, f"HTTP {response.status_code}"
+        # Model errors come back as 200 with no income
+        if response.json().get("qualifying_income_monthly") is None:
+            return seconds, "no income"
+        return seconds, None
+    except requests.RequestException as e:
+        return time.perf_counter() - started, e.__class__.__name__
+
+
+def load_fixtures(include_rules):
+    """The sample paystubs as (name, bytes, borrower data).
+
+    Unless include_rules, those the rules engine answers in milliseconds are
+    left out, so every request reaches the model (the mock server) and the
+    throughput measured is the model path's.
+    """
+    fixtures = []
+    for path in PAYSTUBS:
+        with open(path, "rb") as f:
+            data = f.read()
+        borrower_data = load_borrower(path)
+        if not include_rules and evaluate_salaried(extract_fields_from_pdf(data), borrower_data) is not None:
+            print(f"Leaving out {os.path.relpath(path, ROOT)}: answered by the rules engine (--include-rules-fixtures keeps it)")
+            continue
+        fixtures.append((os.path.relpath(path, ROOT), data, borrower_data))
+    return fixtures
+
+
+def evaluation_counts(url):
+    """The server's underwriter_evaluations_total by path (rules, cache, llm, error), or None if /metrics can't be read."""
+    try:
+        response = requests.get(urljoin(url, "/metrics"), timeout=10)
+        response.raise_for_status()
+    except requests.RequestException:
+        return None
+    return Counter({path: float(value) for path, value in EVALUATIONS.findall(response.text)})
+
+
+def run(url, fixtures, total, concurrency, unique, timeout, warmup):
+    cycle = itertools.cycle(fixtures)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(lambda fixture: send(url, fixture, unique, timeout), [next(cycle) for _ in range(warmup)]))
+        before = evaluation_counts(url)
+        started = time.perf_counter()
+        outcomes = list(pool.map(lambda fixture: send(url, fixture, unique, timeout), [next(cycle) for _ in range(total)]))
+        elapsed = time.perf_counter() - started
+        after = evaluation_counts(url)
+    answered = None
+    if before is not None and after is not None:
+        after.subtract(before)
+        answered = after
+
+    samples = [seconds for seconds, error in outcomes if error is None]
+    errors = Counter(error for _, error in outcomes if error is not None)
+    return summarize(samples, elapsed), errors, elapsed, answered
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Drive /underwrite/ with concurrent requests and report latency percentiles and throughput")
+    parser.add_argument("--url", default="http://localhost:8000/underwrite/")
+    parser.add_argument("--requests", type=int, default=200, help="Timed requests")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight at once")
+    parser.add_argument("--warmup", type=int, default=10, help="Untimed requests sent first")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds before a request counts as failed")
+    parser.add_argument("--repeat-inputs", action="store_true", help="Send the fixtures unchanged, so repeats can be served from the result cache")
+    parser.add_argument("--include-rules-fixtures", action="store_true", help="Also send the paystubs the rules engine answers without the model")
+    parser.add_argument("--save-baseline", action="store_true", help=f"Save the results as benchmarks/baselines/{BASELINE}.json")
+    parser.add_argument("--compare", action="store_true", help="Compare with the saved baseline and exit with status 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p95 slowdown before it counts as a regression")
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.include_rules_fixtures)
+    if not fixtures:
+        sys.exit("Every fixture is answered by the rules engine; pass --include-rules-fixtures")
+    print(f"Sending {args.requests} requests to {args.url} with concurrency {args.concurrency}, cycling through {len(fixtures)} fixtures...")
+    stats, errors, elapsed, answered = run(args.url, fixtures, args.requests, args.concurrency, not args.repeat_inputs, args.timeout, args.warmup)
+    stats["errors"] = sum(errors.values())
+    results = {f"underwrite[c={args.concurrency}]": stats}
+    print_results(results)
+    print(f"\n{stats['count']} ok, {stats['errors']} failed in {elapsed:.1f}s")
+    for error, count in errors.most_common():
+        print(f"  {error}: {count}")
+    if answered is not None:
+        # The server's counts over the timed requests (and any other traffic it got meanwhile)
+        print("Answered by: " + ", ".join(f"{path} {int(answered[path])}" for path in ("rules", "cache", "llm", "error")))
+        if answered["rules"]:
+            print("Warning: some requests never reached the model; start the server with RULES_ENGINE_ENABLED=0 to load the model path only")
+
+    if args.save_baseline:
+        save_baseline(BASELINE, results, {"url": args.url, "requests": args.requests, "concurrency": args.concurrency})
+    if args.compare and compare_baseline(BASELINE, results, metric="p95_ms", tolerance=args.tolerance):
+        sys.exit(1)
@@ -0,0 +1,110 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+import uvicorn
+
+# Stand-in for the OpenAI chat completions endpoint, for load tests and local runs.
+# Point the service at it with OPENAI_BASE_URL=http://127.0.0.1:8001/v1 and any
+# OPENAI_API_KEY. Every completion calls underwrite_income after a configurable delay.
+app = FastAPI()
+
+# fail_next answers that many of the next requests with 429, for deterministic retry checks
+SETTINGS = {"latency": 0.5, "jitter": 0.2, "error_rate": 0.0, "fail_next": 0}
+# Requests received, by outcome
+STATS = {"ok": 0, "rate_limited": 0}
+
+RESULT = {
+    "qualifying_income_monthly": 6500.0,
+    "income_type": "Salaried",
+    "action_items": [
+        "Obtain W-2 forms for the most recent calendar year to confirm the base pay history.",
+        "Complete a verbal verification of employment within 10 business days prior to the note date."
+    ],
+    "guideline_citations": ["B3-3.1-01, General Income Information"]
+}
+
+
+def usage(body, arguments):
+    prompt = sum(len(str(message.get("content") or "")) for message in body.get("messages", [])) // 4
+    completion = len(arguments) // 4
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+
+def completion(body, arguments):
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "mock"),
+        "choices": [{
+            "index": 0,
+            "finish_reason": "tool_calls",
+            "message": {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [{
+                    "id": f"call_{uuid.uuid4().hex[:24]}",
+                    "type": "function",
+                    "function": {"name": "underwrite_income", "arguments": arguments}
+                }]
+            }
+        }],
+        "usage": usage(body, arguments)
+    }
+
+
+async def stream_completion(body, arguments, fragments=8):
+    base = {"id": f"chatcmpl-{uuid.uuid4().hex}", "object": "chat.completion.chunk", "created": int(time.time()), "model": body.get("model", "mock")}
+
+    def chunk(delta, finish_reason=None):
+        return "data: " + json.dumps({**base, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}) + "\n\n"
+
+    yield chunk({"role": "assistant", "tool_calls": [{
+        "index": 0, "id": f"call_{uuid.uuid4().hex[:24]}", "type": "function",
+        "function": {"name": "underwrite_income", "arguments": ""}
+    }]})
+    size = max(1, len(arguments) // fragments)
+    for start in range(0, len(arguments), size):
+        # Spread the generation time over the fragments like a real model would
+        await asyncio.sleep(SETTINGS["latency"] / fragments)
+        yield chunk({"tool_calls": [{"index": 0, "function": {"arguments": arguments[start:start + size]}}]})
+    yield chunk({}, "tool_calls")
+    if (body.get("stream_options") or {}).get("include_usage"):
+        yield "data: " + json.dumps({**base, "choices": [], "usage": usage(body, arguments)}) + "\n\n"
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    if SETTINGS["fail_next"] > 0 or random.random() < SETTINGS["error_rate"]:
+        SETTINGS["fail_next"] = max(0, SETTINGS["fail_next"] - 1)
+        STATS["rate_limited"] += 1
+        return JSONResponse(
+            {"error": {"message": "Rate limit reached (mock)", "type": "requests", "code": "rate_limit_exceeded"}},
+            status_code=429,
+            headers={"retry-after-ms": "200"}
+        )
+    STATS["ok"] += 1
+    arguments = json.dumps(RESULT)
+    if body.get("stream"):
+        return StreamingResponse(stream_completion(body, arguments), media_type="text/event-stream")
+    await asyncio.sleep(SETTINGS["latency"] + random.uniform(0, SETTINGS["jitter"]))
+    return completion(body, arguments)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock OpenAI chat completions server with configurable latency")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=SETTINGS["latency"], help="Seconds before each completion returns")
+    parser.add_argument("--jitter", type=float, default=SETTINGS["jitter"], help="Extra random delay of up to this many seconds")
+    parser.add_argument("--error-rate", type=float, default=SETTINGS["error_rate"], help="Fraction of requests answered with 429")
+    args = parser.parse_args()
+    SETTINGS.update(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
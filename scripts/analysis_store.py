@@ -0,0 +1,112 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.result_cache import cache_key
+
+
+def inputs_key(documents, borrower_data, *versions):
+    """Hash of what an analysis depends on.
+
+    documents are the {"path", "etag", "size"} entries of the application
+    index; the storage ETag changes whenever a document's content does, so
+    nothing has to be downloaded to tell whether a saved analysis still
+    applies. versions are e.g. the model and prompt version. None when a
+    document has neither an ETag nor a size: there's no telling whether it
+    changed, so the analysis has to be run again.
+    """
+    if any(document.get("etag") is None and document.get("size") is None for document in documents):
+        return None
+    fingerprints = sorted((document["path"], document.get("etag"), document.get("size")) for document in documents)
+    return cache_key("analysis", fingerprints, borrower_data, *versions)
+
+
+class AnalysisStore:
+    """Analyses run in the reviewer app, kept in a SQLite file across sessions.
+
+    Each analysis is stored with its application folder, the hash of its
+    inputs (see inputs_key), the result and the document texts it was based
+    on, so reopening an unchanged application is a lookup instead of a
+    download, parse and model call. Older analyses are kept as history.
+    """
+
+    def __init__(self, path=None):
+        self._lock = threading.Lock()
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS analyses (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                folder TEXT NOT NULL COLLATE NOCASE,
+                inputs_key TEXT NOT NULL,
+                borrower_data TEXT,
+                documents TEXT,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS analyses_inputs ON analyses (folder, inputs_key, created_at)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS analyses_created ON analyses (created_at)")
+        self._db.commit()
+
+    @staticmethod
+    def _row(row):
+        return {
+            "id": row[0],
+            "folder": row[1],
+            "borrower_data": json.loads(row[2]) if row[2] else None,
+            "documents": json.loads(row[3]) if row[3] else [],
+            "result": json.loads(row[4]),
+            "created_at": row[5]
+        }
+
+    def find(self, folder, key):
+        """The latest analysis of folder with these inputs, or None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, folder, borrower_data, documents, result, created_at FROM analyses "
+                "WHERE folder = ? AND inputs_key = ? ORDER BY created_at DESC LIMIT 1",
+                (folder, key)
+            ).fetchone()
+        return self._row(row) if row else None
+
+    def save(self, folder, key, result, borrower_data=None, documents=None):
+        """Store an analysis; documents are the [{"name", "content"}] shown next to it."""
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO analyses (folder, inputs_key, borrower_data, documents, result, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (folder, key, json.dumps(borrower_data), json.dumps(documents or []), json.dumps(result), time.time())
+            )
+            self._db.commit()
+            return cursor.lastrowid
+
+    def get(self, analysis_id):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, folder, borrower_data, documents, result, created_at FROM analyses WHERE id = ?",
+                (analysis_id,)
+            ).fetchone()
+        return self._row(row) if row else None
+
+    def count(self, folder=None):
+        with self._lock:
+            if folder is None:
+                return self._db.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+            return self._db.execute("SELECT COUNT(*) FROM analyses WHERE folder = ?", (folder,)).fetchone()[0]
+
+    def history(self, offset=0, limit=20, folder=None):
+        """Analyses newest first, without the document texts: id, folder, result and created_at."""
+        query = "SELECT id, folder, result, created_at FROM analyses"
+        params = []
+        if folder is not None:
+            query += " WHERE folder = ?"
+            params.append(folder)
+        query += " ORDER BY created_at DESC LIMIT ? OFFSET ?"
+        with self._lock:
+            rows = self._db.execute(query, params + [limit, offset]).fetchall()
+        return [{"id": row[0], "folder": row[1], "result": json.loads(row[2]), "created_at": row[3]} for row in rows]
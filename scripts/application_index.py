@@ -0,0 +1,189 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.applications import METADATA_FILE, document_sort_key
+from scripts.sidecar import EXTRACTED_FILE
+
+# Page size used when listing the bucket
+LIST_PAGE_SIZE = 1000
+
+
+class ApplicationIndex:
+    """Local SQLite index of the application folders in a storage bucket.
+
+    `storage` is a Supabase bucket, i.e. supabase.storage.from_(bucket). The
+    folder list is refreshed at most once every `ttl` seconds; a folder's
+    documents and metadata.json are fetched the first time it is opened and
+    again only once its entry is older than `ttl`, and metadata.json is only
+    downloaded again when its ETag changed. Listing and opening applications
+    are then lookups in the index instead of bucket scans.
+    """
+
+    def __init__(self, storage, path=None, ttl=300):
+        self.storage = storage
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS applications (
+                name TEXT PRIMARY KEY COLLATE NOCASE,
+                documents TEXT,
+                metadata TEXT,
+                metadata_etag TEXT,
+                extracted TEXT,
+                indexed_at REAL
+            )
+        """)
+        # Indexes written before extracted.json sidecars existed
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(applications)")}
+        if "extracted" not in columns:
+            self._db.execute("ALTER TABLE applications ADD COLUMN extracted TEXT")
+        self._db.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value REAL)")
+        self._db.commit()
+
+    def _list(self, prefix=""):
+        """Every entry under prefix, one page of the bucket listing at a time."""
+        offset = 0
+        while True:
+            page = self.storage.list(prefix, {
+                "limit": LIST_PAGE_SIZE,
+                "offset": offset,
+                "sortBy": {"column": "name", "order": "asc"}
+            }) or []
+            yield from page
+            if len(page) < LIST_PAGE_SIZE:
+                return
+            offset += LIST_PAGE_SIZE
+
+    def _stale(self, refreshed_at, now):
+        return refreshed_at is None or now - refreshed_at > self.ttl
+
+    def refresh(self, force=False):
+        """Sync the folder list with the bucket once the TTL has passed."""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT value FROM state WHERE key = 'refreshed_at'").fetchone()
+            if not force and not self._stale(row[0] if row else None, now):
+                return False
+            # Folders are the entries without an object id
+            names = [item["name"] for item in self._list() if item.get("id") is None]
+            self._db.execute("CREATE TEMP TABLE IF NOT EXISTS listed (name TEXT PRIMARY KEY COLLATE NOCASE)")
+            self._db.execute("DELETE FROM listed")
+            self._db.executemany("INSERT OR IGNORE INTO listed (name) VALUES (?)", [(name,) for name in names])
+            # Keep what is already known about existing folders; drop deleted ones
+            self._db.execute("INSERT OR IGNORE INTO applications (name) SELECT name FROM listed")
+            self._db.execute("DELETE FROM applications WHERE name NOT IN (SELECT name FROM listed)")
+            self._db.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('refreshed_at', ?)", (now,))
+            self._db.commit()
+            return True
+
+    def count(self, prefix=""):
+        self.refresh()
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM applications WHERE name LIKE ? ESCAPE '\\'", (self._like(prefix),)
+            ).fetchone()[0]
+
+    def page(self, offset=0, limit=50, prefix=""):
+        """Application names starting with prefix (case-insensitive), in name order."""
+        self.refresh()
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT name FROM applications WHERE name LIKE ? ESCAPE '\\' ORDER BY name LIMIT ? OFFSET ?",
+                (self._like(prefix), limit, offset)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    @staticmethod
+    def _like(prefix):
+        escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        return escaped + "%"
+
+    def resolve(self, name):
+        """The indexed folder name for name: an exact (case-insensitive) match or the only prefix match."""
+        name = name.strip().strip("/")
+        self.refresh()
+        with self._lock:
+            row = self._db.execute("SELECT name FROM applications WHERE name = ?", (name,)).fetchone()
+            if row:
+                return row[0]
+            rows = self._db.execute(
+                "SELECT name FROM applications WHERE name LIKE ? ESCAPE '\\' ORDER BY name LIMIT 2", (self._like(name),)
+            ).fetchall()
+        return rows[0][0] if len(rows) == 1 else None
+
+    def get(self, name):
+        """Borrower metadata and document paths of an application, or None if there is no such folder.
+
+        Returns {"name", "borrower_data", "documents", "extracted"} where
+        documents are the folder's PDFs as {"path", "etag", "size"} dicts, path
+        being relative to the bucket, sorted by document number, and extracted
+        is the folder's extracted.json in the same form, or None.
+        """
+        folder = self.resolve(name)
+        if folder is None:
+            return None
+        now = time.time()
+        with self._lock:
+            documents, metadata, etag, extracted, indexed_at = self._db.execute(
+                "SELECT documents, metadata, metadata_etag, extracted, indexed_at FROM applications WHERE name = ?", (folder,)
+            ).fetchone()
+        if documents is None or self._stale(indexed_at, now):
+            documents, metadata, extracted = self._index_folder(folder, metadata, etag, now)
+        else:
+            documents = json.loads(documents)
+            extracted = json.loads(extracted) if extracted else None
+        if metadata is None:
+            return None
+        return {"name": folder, "borrower_data": json.loads(metadata), "documents": documents, "extracted": extracted}
+
+    def _index_folder(self, folder, metadata, etag, now):
+        pdfs = []
+        metadata_item = None
+        extracted = None
+        for item in self._list(folder):
+            if item["name"] == METADATA_FILE:
+                metadata_item = item
+            elif item["name"] == EXTRACTED_FILE:
+                metadata_fields = item.get("metadata") or {}
+                extracted = {
+                    "path": f"{folder}/{item['name']}",
+                    "etag": metadata_fields.get("eTag") or item.get("updated_at"),
+                    "size": metadata_fields.get("size")
+                }
+            elif item["name"].lower().endswith(".pdf"):
+                pdfs.append(item)
+        pdfs.sort(key=lambda item: document_sort_key(item["name"]))
+        documents = []
+        for item in pdfs:
+            metadata_fields = item.get("metadata") or {}
+            documents.append({
+                "path": f"{folder}/{item['name']}",
+                "etag": metadata_fields.get("eTag"),
+                "size": metadata_fields.get("size")
+            })
+
+        if metadata_item is None:
+            metadata, etag = None, None
+        else:
+            current = (metadata_item.get("metadata") or {}).get("eTag") or metadata_item.get("updated_at")
+            if metadata is None or current is None or current != etag:
+                metadata = self.storage.download(f"{folder}/{METADATA_FILE}").decode("utf-8")
+                # Fail here rather than caching a file that isn't JSON
+                json.loads(metadata)
+                etag = current
+
+        with self._lock:
+            self._db.execute(
+                "UPDATE applications SET documents = ?, metadata = ?, metadata_etag = ?, extracted = ?, indexed_at = ? WHERE name = ?",
+                (json.dumps(documents), metadata, etag, json.dumps(extracted) if extracted else None, now, folder)
+            )
+            self._db.commit()
+        return documents, metadata, extracted
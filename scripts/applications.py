@@ -0,0 +1,75 @@
+import json
+import os
+import re
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.pdf_text import read_pdf, pdf_digest
+from scripts.sidecar import EXTRACTED_FILE, sidecar_documents
+
+METADATA_FILE = "metadata.json"
+
+
+def document_sort_key(name):
+    # document_2.pdf sorts before document_10.pdf
+    match = re.search(r"(\d+)", name)
+    return (int(match.group(1)) if match else float("inf"), name)
+
+
+def discover_folders(root):
+    """Return application folders directly under root, i.e. data/<name>/ with a metadata.json."""
+    folders = []
+    for entry in sorted(os.listdir(root)):
+        folder = os.path.join(root, entry)
+        if os.path.isfile(os.path.join(folder, METADATA_FILE)):
+            folders.append(folder)
+    return folders
+
+
+def resolve_folder(root, folder):
+    """Resolve a manifest entry against root, refusing paths that escape it."""
+    root = os.path.realpath(root)
+    path = os.path.realpath(os.path.join(root, folder))
+    if os.path.commonpath([root, path]) != root:
+        raise ValueError(f"Folder {folder!r} is outside of {root}")
+    if not os.path.isfile(os.path.join(path, METADATA_FILE)):
+        raise ValueError(f"Folder {folder!r} has no {METADATA_FILE}")
+    return path
+
+
+def load_sidecar(folder, documents):
+    """Extraction results for documents from the folder's extracted.json, or None if it's missing or stale."""
+    path = os.path.join(folder, EXTRACTED_FILE)
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path, "r") as f:
+            sidecar = json.load(f)
+    except ValueError:
+        return None
+    return sidecar_documents(sidecar, [
+        {"name": os.path.basename(document), "size": os.path.getsize(document), "sha256": pdf_digest(read_pdf(document))}
+        for document in documents
+    ])
+
+
+def load_application(folder):
+    """Load borrower metadata and the PDF documents of an application folder.
+
+    "extracted" holds the extracted.json entries of the documents, in the same
+    order, when the intake sidecar is present and up to date, else None.
+    """
+    with open(os.path.join(folder, METADATA_FILE), "r") as f:
+        borrower_data = json.load(f)
+
+    documents = sorted(
+        (name for name in os.listdir(folder) if name.lower().endswith(".pdf")),
+        key=document_sort_key
+    )
+    documents = [os.path.join(folder, name) for name in documents]
+    return {
+        "name": os.path.basename(os.path.normpath(folder)),
+        "folder": folder,
+        "borrower_data": borrower_data,
+        "documents": documents,
+        "extracted": load_sidecar(folder, documents)
+    }
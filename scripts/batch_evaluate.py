@@ -0,0 +1,169 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.applications import discover_folders, resolve_folder, load_application
+from scripts.parse_paystub import extract_fields_from_pdf
+from scripts.evaluate_income import evaluate as evaluate_income, MODEL, PROMPT_VERSION
+
+# Offline batch runner for back-testing prompt or model changes over application
+# folders laid out like data/<name>/. Results are appended to a JSONL file as they
+# finish, and that file is the checkpoint: running again with the same --output
+# skips every application that already has an "ok" line for the current model,
+# prompt version and --no-rules/--no-cache mode.
+
+
+def checkpoint_key(record):
+    # Lines written before the mode was recorded come from runs with rules and cache on
+    return (
+        record["name"], record.get("model"), record.get("prompt_version"),
+        record.get("use_rules", True), record.get("use_cache", True)
+    )
+
+
+def load_completed(path):
+    """checkpoint_key of every successful result in an earlier run's output."""
+    completed = set()
+    if not os.path.exists(path):
+        return completed
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # The last line of a run that was killed mid-write
+                continue
+            if record.get("status") == "ok":
+                completed.add(checkpoint_key(record))
+    return completed
+
+
+def open_output(path):
+    """Open the output for appending, after ending a line left unfinished by a crash."""
+    output = open(path, "a+")
+    output.seek(0, os.SEEK_END)
+    if output.tell():
+        output.seek(output.tell() - 1)
+        if output.read(1) != "\n":
+            output.write("\n")
+    return output
+
+
+def evaluate(folder, use_rules=True, use_cache=True):
+    """Evaluate one application folder; returns its output record.
+
+    The record's path tells how the income was answered: rules, cache, llm or error.
+    """
+    started = time.perf_counter()
+    record = {"name": os.path.basename(os.path.normpath(folder))}
+    try:
+        application = load_application(folder)
+        if not application["documents"]:
+            raise ValueError("no PDF documents")
+        # Same paystub as the API's batch manifests: the intake sidecar, else the first document
+        if application["extracted"]:
+            paystub_data = application["extracted"][0]["paystub"]
+        else:
+            paystub_data = extract_fields_from_pdf(application["documents"][0])
+        path, result = evaluate_income(paystub_data, application["borrower_data"], use_rules, use_cache)
+        record["path"] = path
+        if result.get("qualifying_income_monthly") is None:
+            record.update(status="error", error=result["action_items"][0] if result.get("action_items") else "No qualifying income", result=result)
+        else:
+            record.update(status="ok", result=result)
+    except Exception as e:
+        record.update(status="error", error=f"{e.__class__.__name__}: {e}")
+    record.update(
+        seconds=round(time.perf_counter() - started, 3),
+        finished_at=datetime.now().isoformat(),
+        model=MODEL,
+        prompt_version=PROMPT_VERSION,
+        use_rules=use_rules,
+        use_cache=use_cache
+    )
+    return record
+
+
+def run(folders, output_path, workers, max_consecutive_errors, use_rules=True, use_cache=True):
+    completed = load_completed(output_path)
+    pending = [
+        folder for folder in folders
+        if (os.path.basename(os.path.normpath(folder)), MODEL, PROMPT_VERSION, use_rules, use_cache) not in completed
+    ]
+    skipped = len(folders) - len(pending)
+    mode = ", ".join(flag for flag, off in (("no rules", not use_rules), ("no cache", not use_cache)) if off)
+    print(f"{len(folders)} applications, {skipped} already done for {MODEL} (prompt {PROMPT_VERSION}{', ' + mode if mode else ''}) in {output_path}, "
+          f"{len(pending)} to evaluate with {workers} workers")
+
+    counts = {"ok": 0, "error": 0}
+    latencies = []
+    consecutive_errors = 0
+    stopped = None
+    started = time.perf_counter()
+    executor = ThreadPoolExecutor(max_workers=workers)
+    remaining = iter(pending)
+    running = set()
+    try:
+        with open_output(output_path) as output:
+            while True:
+                # Keep at most `workers` submitted, so stopping early doesn't leave a queue of paid-for calls
+                while stopped is None and len(running) < workers:
+                    folder = next(remaining, None)
+                    if folder is None:
+                        break
+                    running.add(executor.submit(evaluate, folder, use_rules, use_cache))
+                if not running:
+                    break
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    record = future.result()
+                    # One flushed line per item: a crash loses at most the items in flight
+                    output.write(json.dumps(record) + "\n")
+                    output.flush()
+                    os.fsync(output.fileno())
+                    counts[record["status"]] += 1
+                    latencies.append(record["seconds"])
+                    consecutive_errors = consecutive_errors + 1 if record["status"] == "error" else 0
+                    print(f"[{sum(counts.values())}/{len(pending)}] {record['name']}: {record['status']}"
+                          + (f" ({record['error']})" if record["status"] == "error" else ""))
+                    if max_consecutive_errors and consecutive_errors >= max_consecutive_errors and stopped is None:
+                        # Most likely rate limited or out of quota; the rest can be resumed later
+                        stopped = f"{consecutive_errors} errors in a row"
+    except KeyboardInterrupt:
+        stopped = "interrupted"
+    finally:
+        executor.shutdown(wait=stopped != "interrupted", cancel_futures=True)
+
+    elapsed = time.perf_counter() - started
+    processed = counts["ok"] + counts["error"]
+    latencies.sort()
+    print(f"\n{processed} evaluated in {elapsed:.1f}s ({processed / elapsed if elapsed else 0:.2f}/s), "
+          f"{counts['ok']} ok, {counts['error']} errors ({counts['error'] / processed if processed else 0:.1%}), {skipped} skipped")
+    if latencies:
+        print(f"Latency per application: p50 {latencies[len(latencies) // 2]:.2f}s, max {latencies[-1]:.2f}s")
+    if stopped or len(pending) > processed:
+        print(f"Stopped early ({stopped or 'not all items ran'}); run the same command again to resume")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate every application folder and append the results to a JSONL file; re-run to resume.")
+    parser.add_argument("--root", default="data", help="Directory holding the application folders")
+    parser.add_argument("--folders", nargs="*", help="Only these folders (names under --root); default is every folder with a metadata.json")
+    parser.add_argument("--output", default="batch_results.jsonl", help="JSONL file results are appended to, and resumed from")
+    parser.add_argument("--workers", type=int, default=4, help="Applications evaluated at once")
+    parser.add_argument("--max-consecutive-errors", type=int, default=10, help="Stop after this many failures in a row (e.g. rate limits); 0 never stops")
+    parser.add_argument("--no-cache", action="store_true", help="Don't answer from the result cache; fresh answers are still cached")
+    parser.add_argument("--no-rules", action="store_true", help="Send salaried stubs to the model instead of the rules engine")
+    args = parser.parse_args()
+
+    if args.folders:
+        folders = [resolve_folder(args.root, folder) for folder in args.folders]
+    else:
+        folders = discover_folders(args.root)
+    sys.exit(run(folders, args.output, args.workers, args.max_consecutive_errors, use_rules=not args.no_rules, use_cache=not args.no_cache))
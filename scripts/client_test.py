@@ -23,9 +23,72 @@ def main(pdf_path, borrower_json_path):
             print(response.status_code)
             print(response.text)
 
+def main_stream(pdf_path, borrower_json_path):
+    url = "http://localhost:8000/underwrite/stream"
+
+    with open(pdf_path, "rb") as f, open(borrower_json_path, "r") as meta_file:
+        files = {"file": ("paystub.pdf", f, "application/pdf")}
+        data = {"borrower_json": meta_file.read()}
+
+        print(f"Sending request to {url}...")
+        with requests.post(url, files=files, data=data, stream=True) as response:
+            if response.status_code != 200:
+                print("❌ Error:")
+                print(response.status_code)
+                print(response.text)
+                return
+
+            # Server-Sent Events: "event: <name>" and "data: <json>" lines, blank line between events
+            event = None
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                elif line.startswith("data: "):
+                    payload = json.loads(line[len("data: "):])
+                    if event == "delta":
+                        print(payload["arguments"], end="", flush=True)
+                    elif event == "result":
+                        print("\n✅ Underwriting report:")
+                        print(json.dumps(payload, indent=2))
+                    else:
+                        print(f"[{event}] {json.dumps(payload)}")
+
+def main_batch(folders, concurrency=None):
+    url = "http://localhost:8000/underwrite/batch"
+    manifest = {"folders": folders} if folders else {}
+    params = {"concurrency": concurrency} if concurrency else {}
+
+    print(f"Sending batch request to {url}...")
+    with requests.post(url, data={"manifest": json.dumps(manifest)}, params=params, stream=True) as response:
+        if response.status_code != 200:
+            print("❌ Error:")
+            print(response.status_code)
+            print(response.text)
+            return
+
+        # Results arrive one JSON object per line as each underwrite finishes
+        for line in response.iter_lines():
+            if not line:
+                continue
+            item = json.loads(line)
+            if item["status"] == "ok":
+                print(f"✅ {item['name']}: {item['result'].get('qualifying_income_monthly')}")
+            else:
+                print(f"❌ {item['name']}: {item['error']}")
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Test local underwriting API client.")
-    parser.add_argument("--paystub", required=True, help="Path to the PDF file.")
-    parser.add_argument("--borrower", required=True, help="Path to the borrower metadata JSON.")
+    parser.add_argument("--paystub", help="Path to the PDF file.")
+    parser.add_argument("--borrower", help="Path to the borrower metadata JSON.")
+    parser.add_argument("--batch", nargs="*", metavar="FOLDER", help="Underwrite application folders (relative to the server's BATCH_DATA_ROOT) in one batch; pass no folder names to run all of them.")
+    parser.add_argument("--stream", action="store_true", help="Use the streaming endpoint and print events as they arrive.")
+    parser.add_argument("--concurrency", type=int, help="Batch concurrency limit.")
     args = parser.parse_args()
-    main(args.paystub, args.borrower)
+    if args.batch is not None:
+        main_batch(args.batch, args.concurrency)
+    elif args.paystub and args.borrower and args.stream:
+        main_stream(args.paystub, args.borrower)
+    elif args.paystub and args.borrower:
+        main(args.paystub, args.borrower)
+    else:
+        parser.error("--paystub and --borrower are required unless --batch is given")
@@ -0,0 +1,106 @@
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.result_cache import ResultCache, cache_key
+from scripts.parse_paystub import extract_document_pages
+from scripts.sidecar import sidecar_documents
+
+# Documents downloaded and parsed at once; downloads are I/O bound, so this can
+# be well above the CPU count
+DOCUMENT_FETCH_WORKERS = int(os.getenv("DOCUMENT_FETCH_WORKERS", "8"))
+
+# Page texts of stored documents keyed by object path and ETag/size, so opening an
+# application again doesn't download anything. Set DOCUMENT_TEXT_CACHE_PATH to an
+# empty string to keep the cache in memory only.
+document_cache = ResultCache(
+    path=os.getenv("DOCUMENT_TEXT_CACHE_PATH", ".cache/document_text.sqlite3") or None,
+    ttl=float(os.getenv("DOCUMENT_TEXT_CACHE_TTL", str(30 * 24 * 3600))),
+    max_memory_entries=int(os.getenv("DOCUMENT_TEXT_CACHE_MEMORY_ENTRIES", "512")),
+    max_disk_bytes=int(os.getenv("DOCUMENT_TEXT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+)
+
+_executor = ThreadPoolExecutor(max_workers=DOCUMENT_FETCH_WORKERS)
+
+
+def document_key(document):
+    # Without an ETag or size there is no way to tell the object changed, so don't cache it
+    if document.get("etag") is None and document.get("size") is None:
+        return None
+    return cache_key("document", document["path"], document.get("etag"), document.get("size"))
+
+
+def _fetch(storage, document):
+    started = time.perf_counter()
+    data = storage.download(document["path"])
+    pages, _ = extract_document_pages(data)
+    key = document_key(document)
+    if key is not None:
+        document_cache.set(key, pages, seconds=time.perf_counter() - started)
+    return pages
+
+
+def fetch_document_texts(storage, documents):
+    """Page texts of stored PDFs, downloading and parsing them concurrently.
+
+    documents are {"path", "etag", "size"} dicts as listed by the application
+    index and storage is the bucket to download them from. Each document is
+    parsed as soon as its download completes, so the whole batch takes about as
+    long as the slowest document. Returns one list of page texts per document,
+    in the same order, or the exception if that document failed.
+    """
+    results = [None] * len(documents)
+    futures = {}
+    for position, document in enumerate(documents):
+        key = document_key(document)
+        pages = document_cache.get(key) if key is not None else None
+        if pages is not None:
+            results[position] = pages
+        else:
+            futures[_executor.submit(_fetch, storage, document)] = position
+
+    for future in as_completed(futures):
+        try:
+            results[futures[future]] = future.result()
+        except Exception as e:
+            results[futures[future]] = e
+    return results
+
+
+def _load_sidecar(storage, sidecar):
+    key = document_key(sidecar)
+    cached = document_cache.get(key) if key is not None else None
+    if cached is not None:
+        return cached
+    started = time.perf_counter()
+    data = json.loads(storage.download(sidecar["path"]).decode("utf-8"))
+    if key is not None:
+        document_cache.set(key, data, seconds=time.perf_counter() - started)
+    return data
+
+
+def fetch_application_texts(storage, application):
+    """fetch_document_texts for an indexed application, preferring its extracted.json.
+
+    When the intake sidecar covers every document (same names, and MD5s equal
+    to the stored ETags), the page texts come from that one small file and no
+    PDF is downloaded.
+    """
+    documents = application["documents"]
+    if application.get("extracted"):
+        try:
+            entries = sidecar_documents(
+                _load_sidecar(storage, application["extracted"]),
+                [
+                    {"name": os.path.basename(document["path"]), "size": document.get("size"), "etag": document.get("etag")}
+                    for document in documents
+                ]
+            )
+        except Exception as e:
+            print(f"Warning: could not read {application['extracted']['path']}: {e}")
+            entries = None
+        if entries is not None:
+            return [entry["pages"] for entry in entries]
+    return fetch_document_texts(storage, documents)
@@ -0,0 +1,114 @@
+import hashlib
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.parse_paystub import paystub_fields
+
+# Borrowers upload the same paystub twice and statements repeat boilerplate pages.
+# Pages whose word shingles overlap at least this much (Jaccard) with a page
+# already kept are dropped; identical pages are caught by their hash first.
+DUPLICATE_PAGE_SIMILARITY = float(os.getenv("DUPLICATE_PAGE_SIMILARITY", "0.9"))
+SHINGLE_WORDS = 5
+
+
+def _shingles(words):
+    if len(words) <= SHINGLE_WORDS:
+        return {tuple(words)}
+    return {tuple(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+class PageDeduplicator:
+    """Remembers the pages seen so far and tells whether a new one repeats any of them."""
+
+    def __init__(self, similarity=DUPLICATE_PAGE_SIMILARITY):
+        self.similarity = similarity
+        self._hashes = {}
+        self._kept = []
+
+    def check(self, text, source):
+        """Return the source of the page this one duplicates, or None after recording it as new.
+
+        source identifies the page, e.g. (document name, page index).
+        """
+        words = text.lower().split()
+        if not words:
+            # Blank pages carry nothing worth sending
+            return source
+        digest = hashlib.sha256(" ".join(words).encode("utf-8")).hexdigest()
+        if digest in self._hashes:
+            return self._hashes[digest]
+        shingles = _shingles(words)
+        for kept_shingles, kept_source in self._kept:
+            # Jaccard can't reach the threshold when the sizes are too far apart
+            smaller, larger = sorted((len(shingles), len(kept_shingles)))
+            if smaller < self.similarity * larger:
+                continue
+            overlap = len(shingles & kept_shingles)
+            if overlap / (len(shingles) + len(kept_shingles) - overlap) >= self.similarity:
+                return kept_source
+        self._hashes[digest] = source
+        self._kept.append((shingles, source))
+        return None
+
+
+def _recency(fields):
+    return fields.get("pay_date") or fields.get("pay_period_end") or ""
+
+
+def summarize_documents(documents):
+    """Paystub data for an application from [(document name, page texts or exception), ...].
+
+    Duplicate pages are dropped across all documents, the field extractor runs
+    on each document's unique pages, and the model gets one compact entry per
+    document instead of the concatenated text. The most recent paystub's
+    fields stay at the top level (its entry is marked primary), so the rules
+    engine can still answer plain salaried cases; raw_text holds the start of
+    each document's unique text.
+    """
+    deduplicator = PageDeduplicator()
+    summaries = []
+    texts = []
+    primary = None
+    primary_summary = None
+    variable_income = False
+    for name, pages in documents:
+        if isinstance(pages, Exception):
+            summaries.append({"name": name, "error": str(pages)})
+            continue
+        unique = []
+        duplicates = set()
+        for index, text in enumerate(pages):
+            duplicate_of = deduplicator.check(text or "", (name, index))
+            if duplicate_of is None:
+                unique.append(text)
+            elif duplicate_of[0] != name and text and text.strip():
+                duplicates.add(duplicate_of[0])
+
+        summary = {"name": name, "pages": len(pages), "unique_pages": len(unique)}
+        if not unique:
+            # Nothing new in this document, e.g. the same paystub uploaded twice
+            if duplicates:
+                summary["duplicate_of"] = sorted(duplicates)
+            summaries.append(summary)
+            continue
+        fields = paystub_fields("\n".join(unique))
+        summary["fields"] = {
+            key: value for key, value in fields.items()
+            if key not in ("confidence", "raw_text", "variable_income") and value is not None
+        }
+        summaries.append(summary)
+        texts.append(f"[{name}]\n{fields['raw_text']}")
+        variable_income = variable_income or fields["variable_income"]
+        if primary is None or _recency(fields) > _recency(primary):
+            primary, primary_summary = fields, summary
+
+    if primary_summary is not None:
+        # Its fields are the top-level ones; don't send them twice
+        del primary_summary["fields"]
+        primary_summary["primary"] = True
+    paystub_data = {key: value for key, value in (primary or {}).items() if key != "raw_text"}
+    # Overtime or a bonus on any document keeps the application away from the rules engine
+    paystub_data["variable_income"] = variable_income
+    paystub_data["documents"] = summaries
+    paystub_data["raw_text"] = "\n\n".join(texts)
+    return paystub_data
@@ -1,25 +1,41 @@
-from openai import OpenAI
+import asyncio
 import json
 import sys
 import os
-import pdfplumber
 import argparse
+import re
+import time
 from dotenv import load_dotenv
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts import llm_client, metrics
+from scripts.llm_client import chat_completion, chat_completion_async
+from scripts.result_cache import ResultCache, cache_key
+from scripts.pdf_text import extract_text
+from scripts.guideline_index import GuidelineIndex, build_query
+from scripts.prompt_builder import build_prompt, describe_report, PROMPT_TOKEN_BUDGET
+from scripts.rules_engine import evaluate_salaried
 
 # Load environment variables from .env file
 load_dotenv()
 
-from openai import OpenAI
+MODEL = "gpt-4-1106-preview"
+# Bump whenever the prompt (see prompt_builder.py) changes so cached results are not reused
+PROMPT_VERSION = "4"
 
-# Initialize OpenAI client with API key from environment variables
-api_key = os.getenv("OPENAI_API_KEY")
-client = None
+# Local retrieval index over the Fannie Mae guide, built by prepare_guidelines.py.
+# When it exists, only the top-k relevant sections go into the prompt.
+GUIDELINE_INDEX_PATH = os.getenv("GUIDELINE_INDEX_PATH", "guidelines.idx")
+GUIDELINE_TOP_K = int(os.getenv("GUIDELINE_TOP_K", "5"))
+_guideline_index = None
 
-# Only initialize the client if the API key is available
-if api_key:
-    client = OpenAI(api_key=api_key)
-else:
-    print("Warning: OPENAI_API_KEY environment variable not set")
+# Results are cached by a hash of the inputs, model, tool schema and prompt version.
+# Set RESULT_CACHE_PATH to an empty string to keep the cache in memory only.
+result_cache = ResultCache(
+    path=os.getenv("RESULT_CACHE_PATH", ".cache/run_assistant.sqlite3") or None,
+    ttl=float(os.getenv("RESULT_CACHE_TTL", str(7 * 24 * 3600))),
+    max_memory_entries=int(os.getenv("RESULT_CACHE_MEMORY_ENTRIES", "256")),
+    max_disk_bytes=int(os.getenv("RESULT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+)
 
 # Function tool schema
 tools = [
@@ -56,57 +72,230 @@ tools = [
     }
 ]
 
+def error_result(message):
+    # No income figure rather than $0, so a failed call can't pass for a real result
+    return {
+        "qualifying_income_monthly": None,
+        "income_type": "Salaried",
+        "action_items": [message],
+        "guideline_citations": []
+    }
+
+def get_guideline_index():
+    global _guideline_index
+    if _guideline_index is None and GUIDELINE_INDEX_PATH and os.path.exists(GUIDELINE_INDEX_PATH):
+        _guideline_index = GuidelineIndex(GUIDELINE_INDEX_PATH)
+    return _guideline_index
+
+def retrieve_guidelines(paystub_data, borrower_data):
+    index = get_guideline_index()
+    if index is None:
+        return []
+    return index.search(build_query(paystub_data, borrower_data), k=GUIDELINE_TOP_K)
+
+def build_messages(paystub_data, borrower_data, guidelines=None):
+    prompt, report = build_prompt(paystub_data, borrower_data, guidelines)
+    print(describe_report(report))
+    return [
+        {"role": "system", "content": "You are a mortgage underwriting assistant."},
+        {"role": "user", "content": prompt}
+    ]
+
+def validate_result(result):
+    """Check a result against the underwrite_income schema; raises ValueError if it doesn't fit."""
+    if not isinstance(result, dict):
+        raise ValueError("underwrite_income arguments are not an object")
+    if not isinstance(result.get("qualifying_income_monthly"), (int, float)):
+        raise ValueError("qualifying_income_monthly is missing or not a number")
+    if result.get("income_type") != "Salaried":
+        raise ValueError("income_type is missing or not Salaried")
+    if not isinstance(result.get("action_items"), list):
+        raise ValueError("action_items is missing or not a list")
+    result.setdefault("guideline_citations", [])
+    return result
+
+def parse_response(response):
+    tool_call = response.choices[0].message.tool_calls[0]
+    return validate_result(json.loads(tool_call.function.arguments))
+
+def result_key(paystub_data, borrower_data):
+    index = get_guideline_index()
+    index_version = index.version if index else None
+    return cache_key(MODEL, tools, PROMPT_VERSION, PROMPT_TOKEN_BUDGET, index_version, paystub_data, borrower_data)
+
+def record_usage(usage):
+    if usage:
+        metrics.LLM_TOKENS.inc(usage.prompt_tokens, kind="prompt")
+        metrics.LLM_TOKENS.inc(usage.completion_tokens, kind="completion")
+
+def store_result(key, result, response, started):
+    record_usage(response.usage)
+    tokens = response.usage.total_tokens if response.usage else None
+    result_cache.set(key, result, seconds=time.perf_counter() - started, tokens=tokens)
+
+def failed(message, error=None):
+    """error_result for a failed evaluation, counted in the metrics."""
+    if error is not None:
+        metrics.record_error("llm", error)
+    metrics.EVALUATIONS.inc(path="error")
+    return error_result(message)
+
+def answer_locally(paystub_data, borrower_data, use_rules=True, use_cache=True):
+    """Return (cache key, result), the result coming from the rules engine or the cache; None if the model is needed.
+
+    The key is None only for rules engine answers. use_rules and use_cache
+    skip those sources; a result from the model is still cached.
+    """
+    # Straightforward salaried stubs are calculated locally in milliseconds
+    if use_rules:
+        with metrics.stage("rules_engine"):
+            result = evaluate_salaried(paystub_data, borrower_data)
+        if result is not None:
+            metrics.EVALUATIONS.inc(path="rules")
+            return None, result
+
+    with metrics.stage("cache_lookup"):
+        key = result_key(paystub_data, borrower_data)
+        cached = result_cache.get(key) if use_cache else None
+    if cached is not None:
+        metrics.EVALUATIONS.inc(path="cache")
+    return key, cached
+
+def prepare_messages(paystub_data, borrower_data):
+    with metrics.stage("prompt"):
+        return build_messages(paystub_data, borrower_data, retrieve_guidelines(paystub_data, borrower_data))
+
+# The income figure in a partial tool call, e.g. '{"qualifying_income_monthly": 6500.0,'
+PARTIAL_INCOME = re.compile(r'"qualifying_income_monthly"\s*:\s*(-?\d+(?:\.\d+)?)\s*[,}]')
+
 def run_assistant(paystub_data, borrower_data):
+    return evaluate(paystub_data, borrower_data)[1]
+
+def evaluate(paystub_data, borrower_data, use_rules=True, use_cache=True):
+    """run_assistant, returning (path, result) where path tells how it was answered: rules, cache, llm or error."""
     print("Starting analysis...")
+
+    key, result = answer_locally(paystub_data, borrower_data, use_rules, use_cache)
+    if result is not None:
+        return ("rules" if key is None else "cache"), result
     
     # Check if OpenAI client is initialized
-    if not client:
-        return {
-            "qualifying_income_monthly": 0,
-            "income_type": "Salaried",
-            "action_items": ["Error: OpenAI API key not set. Please set the OPENAI_API_KEY environment variable."],
-            "guideline_citations": []
-        }
+    if not llm_client.client:
+        return "error", failed("Error: OpenAI API key not set. Please set the OPENAI_API_KEY environment variable.")
     
-    prompt = f"""
-You are an expert mortgage underwriting assistant following Fannie Mae guidelines.
+    try:
+        messages = prepare_messages(paystub_data, borrower_data)
+        started = time.perf_counter()
+        with metrics.stage("llm"):
+            response = chat_completion(
+                model=MODEL,
+                messages=messages,
+                tools=tools,
+                tool_choice="auto",
+                max_tokens=1000
+            )
+        result = parse_response(response)
+        store_result(key, result, response, started)
+        metrics.EVALUATIONS.inc(path="llm")
+        return "llm", result
+        
+    except Exception as e:
+        return "error", failed(f"Error: {str(e)}. Please review manually.", e)
+
+async def run_assistant_async(paystub_data, borrower_data):
+    """Same as run_assistant, but awaits the completion instead of blocking the caller's thread.
+
+    The rules engine, cache, guideline search and prompt token counting are
+    synchronous, so they run in a worker thread rather than on the event loop.
+    """
+    print("Starting analysis...")
+
+    key, result = await asyncio.to_thread(answer_locally, paystub_data, borrower_data)
+    if result is not None:
+        return result
+
+    if not llm_client.async_client:
+        return failed("Error: OpenAI API key not set. Please set the OPENAI_API_KEY environment variable.")
+
+    try:
+        messages = await asyncio.to_thread(prepare_messages, paystub_data, borrower_data)
+        started = time.perf_counter()
+        with metrics.stage("llm"):
+            response = await chat_completion_async(
+                model=MODEL,
+                messages=messages,
+                tools=tools,
+                tool_choice="auto",
+                max_tokens=1000
+            )
+        result = parse_response(response)
+        await asyncio.to_thread(store_result, key, result, response, started)
+        metrics.EVALUATIONS.inc(path="llm")
+        return result
+
+    except Exception as e:
+        return failed(f"Error: {str(e)}. Please review manually.", e)
 
-Use the following extracted paystub data and borrower application data to determine the qualifying monthly income.
+async def stream_assistant(paystub_data, borrower_data):
+    """Stream the evaluation as (event, data) pairs.
 
-Paystub Data:
-{json.dumps(paystub_data, indent=2)}
+    Yields "llm_started", then "delta" events with fragments of the tool call
+    arguments as they arrive, an "income" event as soon as the income figure is
+    complete, and finally "result" with the validated underwrite_income payload.
+    Rules engine answers and cache hits yield "result" straight away. Blocking
+    steps run in a worker thread, as in run_assistant_async.
+    """
+    key, result = await asyncio.to_thread(answer_locally, paystub_data, borrower_data)
+    if result is not None:
+        yield "result", result
+        return
 
-Borrower Info:
-{json.dumps(borrower_data, indent=2)}
+    if not llm_client.async_client:
+        yield "result", failed("Error: OpenAI API key not set. Please set the OPENAI_API_KEY environment variable.")
+        return
 
-Respond with:
-- Monthly qualifying income
-- Income type (Salaried)
-- Action items (e.g., missing docs, clarification needs)
-- Guideline references (e.g., B3-3.1-05)
-"""
+    yield "llm_started", {"model": MODEL}
     try:
-        response = client.chat.completions.create(
-            model="gpt-4-1106-preview",
-            messages=[
-                {"role": "system", "content": "You are a mortgage underwriting assistant."},
-                {"role": "user", "content": prompt}
-            ],
+        messages = await asyncio.to_thread(prepare_messages, paystub_data, borrower_data)
+        started = time.perf_counter()
+        stream = await chat_completion_async(
+            model=MODEL,
+            messages=messages,
             tools=tools,
             tool_choice="auto",
-            max_tokens=1000
+            max_tokens=1000,
+            stream=True,
+            stream_options={"include_usage": True}
         )
-        
-        tool_call = response.choices[0].message.tool_calls[0]
-        return json.loads(tool_call.function.arguments)
-        
+        arguments = ""
+        income_sent = False
+        usage = None
+        async for chunk in stream:
+            if chunk.usage:
+                usage = chunk.usage
+            if not chunk.choices or not chunk.choices[0].delta.tool_calls:
+                continue
+            fragment = chunk.choices[0].delta.tool_calls[0].function.arguments or ""
+            if not fragment:
+                continue
+            arguments += fragment
+            yield "delta", {"arguments": fragment}
+            if not income_sent:
+                match = PARTIAL_INCOME.search(arguments)
+                if match:
+                    income_sent = True
+                    yield "income", {"qualifying_income_monthly": float(match.group(1))}
+
+        seconds = time.perf_counter() - started
+        metrics.STAGE_SECONDS.observe(seconds, stage="llm")
+        record_usage(usage)
+        result = validate_result(json.loads(arguments))
+        await asyncio.to_thread(result_cache.set, key, result, seconds, usage.total_tokens if usage else None)
+        metrics.EVALUATIONS.inc(path="llm")
+        yield "result", result
+
     except Exception as e:
-        return {
-            "qualifying_income_monthly": 0,
-            "income_type": "Salaried",
-            "action_items": [f"Error: {str(e)}. Please review manually."],
-            "guideline_citations": []
-        }
+        yield "result", failed(f"Error: {str(e)}. Please review manually.", e)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Evaluate borrower income using Fannie Mae guidelines")
@@ -119,12 +308,8 @@ if __name__ == "__main__":
         borrower_data = json.load(f)
 
     # Process the paystub
-    with pdfplumber.open(args.paystub) as pdf:
-        paystub_text = "\n".join(
-            page.extract_text() for page in pdf.pages 
-            if page.extract_text()
-        )
-        paystub_data = {"text": paystub_text.strip()}
+    paystub_text = extract_text(args.paystub)
+    paystub_data = {"text": paystub_text.strip()}
 
     result = run_assistant(paystub_data, borrower_data)
     print(json.dumps(result, indent=2))
@@ -0,0 +1,225 @@
+import re
+from datetime import date, datetime
+
+# Building blocks for field patterns. Every pattern captures values with named
+# groups whose names are field names, e.g. (?P<gross_pay_per_period>...).
+MONEY = r"\$?[ \t]*-?\d[\d,]*(?:\.\d{1,2})?"
+NUMBER = r"\d[\d,]*(?:\.\d+)?"
+DATE = r"\d{1,2}/\d{1,2}/\d{2,4}|\d{4}-\d{2}-\d{2}"
+SEP = r"[ \t]*:?[ \t]*"
+
+DATE_FORMATS = ("%m/%d/%Y", "%m/%d/%y", "%Y-%m-%d")
+
+FREQUENCIES = {
+    "weekly": "Weekly",
+    "biweekly": "Biweekly",
+    "bi-weekly": "Biweekly",
+    "semimonthly": "Semimonthly",
+    "semi-monthly": "Semimonthly",
+    "monthly": "Monthly"
+}
+
+
+def _money(value):
+    return float(value.replace("$", "").replace(",", "").strip())
+
+
+def _date(value):
+    for fmt in DATE_FORMATS:
+        try:
+            return str(datetime.strptime(value, fmt).date())
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognized date {value!r}")
+
+
+def _text(value):
+    value = value.strip()
+    if not value:
+        raise ValueError("Empty value")
+    return value
+
+
+def _frequency(value):
+    return FREQUENCIES[value.lower().replace(" ", "")]
+
+
+# How each field's captured text is turned into a value
+FIELD_PARSERS = {
+    "gross_pay_per_period": _money,
+    "ytd_income": _money,
+    "net_pay": _money,
+    "hours": _money,
+    "rate": _money,
+    "pay_period_start": _date,
+    "pay_period_end": _date,
+    "pay_date": _date,
+    "employer_name": _text,
+    "pay_frequency": _frequency
+}
+
+
+def _capture(field, pattern):
+    return f"(?P<{field}>{pattern})"
+
+
+class FieldExtractor:
+    """Registry of precompiled field patterns, matched in a single pass over the text.
+
+    Every pattern is registered under one or more keywords. The text is scanned
+    once for all keywords together, and a pattern is only tried (anchored) where
+    one of its keywords starts a word, so adding patterns doesn't add passes.
+    When several matches produce the same field, the one with the highest
+    confidence wins (the first one on ties).
+    """
+
+    def __init__(self):
+        self._by_keyword = {}
+        self._keywords = None
+
+    def register(self, keywords, pattern, confidence):
+        """Try pattern wherever one of the lowercase keywords starts a word.
+
+        The pattern is matched case-insensitively starting at the keyword, and
+        its named groups must be keys of FIELD_PARSERS.
+        """
+        compiled = re.compile(pattern, re.IGNORECASE | re.MULTILINE)
+        unknown = set(compiled.groupindex) - set(FIELD_PARSERS)
+        if unknown:
+            raise ValueError(f"Unknown fields in pattern: {', '.join(sorted(unknown))}")
+        for keyword in keywords:
+            self._by_keyword.setdefault(keyword.lower(), []).append((compiled, confidence, list(compiled.groupindex)))
+        self._keywords = None
+
+    def _compile(self):
+        # Longest keywords first so "payment" wins over "pay"
+        keywords = sorted(self._by_keyword, key=len, reverse=True)
+        alternation = "|".join(re.escape(keyword) for keyword in keywords)
+        self._keywords = re.compile(alternation)
+        self._keywords_ignorecase = re.compile(alternation, re.IGNORECASE)
+
+    def extract(self, text):
+        """Return (fields, confidence) for every field found in text."""
+        if self._keywords is None:
+            self._compile()
+        # Scanning lowercased text lets the keyword search skip case folding;
+        # positions only line up if lowercasing kept the length
+        lowered = text.lower()
+        if len(lowered) == len(text):
+            hits = self._keywords.finditer(lowered)
+        else:
+            hits = self._keywords_ignorecase.finditer(text)
+
+        fields = {}
+        confidence = {}
+        for hit in hits:
+            start = hit.start()
+            if start and text[start - 1].isalnum():
+                continue
+            for pattern, score, names in self._by_keyword[hit.group().lower()]:
+                if all(confidence.get(field, -1.0) >= score for field in names):
+                    continue
+                match = pattern.match(text, start)
+                if match is None:
+                    continue
+                for field in names:
+                    value = match.group(field)
+                    if value is None or confidence.get(field, -1.0) >= score:
+                        continue
+                    try:
+                        fields[field] = FIELD_PARSERS[field](value)
+                    except (ValueError, KeyError):
+                        continue
+                    confidence[field] = score
+        _infer_frequency(fields, confidence)
+        return fields, confidence
+
+
+def _infer_frequency(fields, confidence):
+    """Fall back to the length of the pay period when no frequency is printed."""
+    if "pay_frequency" in fields or "pay_period_start" not in fields or "pay_period_end" not in fields:
+        return
+    start = date.fromisoformat(fields["pay_period_start"])
+    end = date.fromisoformat(fields["pay_period_end"])
+    days = (end - start).days + 1
+    if days == 7:
+        frequency = "Weekly"
+    elif days == 14:
+        frequency = "Biweekly"
+    elif 13 <= days <= 16 and start.day in (1, 16):
+        frequency = "Semimonthly"
+    elif 28 <= days <= 31 and start.day == 1:
+        frequency = "Monthly"
+    else:
+        return
+    fields["pay_frequency"] = frequency
+    confidence["pay_frequency"] = 0.7
+
+
+default_extractor = FieldExtractor()
+
+# Current and YTD amounts on one line, e.g. "GROSS PAY: $7,609.38 $25,350.00"
+default_extractor.register(
+    ["gross"],
+    r"gross[ \t]+(?:pay|earnings|wages)" + SEP + _capture("gross_pay_per_period", MONEY) + r"[ \t]+" + _capture("ytd_income", MONEY),
+    0.95
+)
+default_extractor.register(["gross"], r"gross[ \t]+ytd" + SEP + _capture("ytd_income", MONEY), 0.9)
+# Not "YTD Gross: ...", which is the year-to-date total
+default_extractor.register(["gross"], r"(?<!ytd[ \t])gross(?:[ \t]+(?:pay|earnings|wages))?" + SEP + _capture("gross_pay_per_period", MONEY), 0.9)
+default_extractor.register(
+    ["ytd", "year"],
+    r"(?:ytd|year[ \t]+to[ \t]+date)[ \t]+(?:gross|earnings|income|total)" + SEP + _capture("ytd_income", MONEY),
+    0.9
+)
+default_extractor.register(["net"], r"net[ \t]+pay" + SEP + _capture("net_pay", MONEY), 0.9)
+# Earnings table row at the start of a line, e.g. "Base Salary 80.00 81.25 $6,500.00 $19,500.00"
+default_extractor.register(
+    ["base", "regular"],
+    r"(?<![^\n])(?:base[ \t]+(?:salary|pay)|regular(?:[ \t]+(?:pay|earnings))?)[ \t]+" + _capture("hours", NUMBER) + r"[ \t]+" + _capture("rate", MONEY),
+    0.8
+)
+default_extractor.register(["hours"], r"hours(?:[ \t]+worked)?" + SEP + _capture("hours", NUMBER), 0.85)
+# Skip percentages such as "401(k) Contribution Rate: 6%"
+default_extractor.register(
+    ["hourly", "pay", "rate"],
+    r"(?:hourly[ \t]+|pay[ \t]+)?rate" + SEP + _capture("rate", MONEY) + r"(?![\d.,]*%)",
+    0.85
+)
+default_extractor.register(
+    ["pay"],
+    r"pay[ \t]+period" + SEP + _capture("pay_period_start", DATE) + r"[ \t]*(?:-|to|through)[ \t]*" + _capture("pay_period_end", DATE),
+    0.95
+)
+default_extractor.register(["period"], r"period[ \t]+(?:start|begin)(?:s|ning)?(?:[ \t]+date)?" + SEP + _capture("pay_period_start", DATE), 0.85)
+default_extractor.register(["period"], r"period[ \t]+end(?:s|ing)?(?:[ \t]+date)?" + SEP + _capture("pay_period_end", DATE), 0.85)
+default_extractor.register(["pay", "check", "payment"], r"(?:pay|check|payment)[ \t]+date" + SEP + _capture("pay_date", DATE), 0.95)
+default_extractor.register(
+    ["employer", "company"],
+    r"(?:employer|company)(?:[ \t]+name)?[ \t]*:[ \t]*" + _capture("employer_name", r"[^\n]+"),
+    0.95
+)
+default_extractor.register(
+    ["pay", "frequency"],
+    r"(?:pay[ \t]+)?frequency" + SEP + _capture("pay_frequency", r"weekly|bi-?weekly|semi-?monthly|monthly"),
+    0.95
+)
+default_extractor.register(
+    ["biweekly", "bi-weekly", "semimonthly", "semi-monthly"],
+    _capture("pay_frequency", r"bi-?weekly|semi-?monthly") + r"\b",
+    0.6
+)
+
+# Most stubs open with the employer's name in capitals
+EMPLOYER_HEADER = re.compile(r"[ \t]*(?P<employer_name>[A-Z][A-Z0-9&.,' -]{2,})[ \t]*$", re.MULTILINE)
+
+
+def extract_fields(text, extractor=None):
+    """Extract paystub fields from text; returns (fields, confidence)."""
+    fields, confidence = (extractor or default_extractor).extract(text)
+    if "employer_name" not in fields:
+        header = EMPLOYER_HEADER.match(text)
+        if header:
+            fields["employer_name"] = header.group("employer_name").strip()
+            confidence["employer_name"] = 0.5
+    return fields, confidence
@@ -0,0 +1,215 @@
+import hashlib
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+from array import array
+
+# On-disk layout (all integers little-endian):
+#   magic (8 bytes) | header length (uint64) | JSON header | padding to 8 bytes
+#   postings: uint32 pairs (chunk id, term frequency), grouped by term
+#   chunk lengths: uint32 per chunk
+#   chunk offsets: uint64 per chunk + 1, into the chunk records
+#   chunk records: one JSON object per chunk
+# The header maps every term to (first posting, document frequency), so a lookup
+# only touches the postings of the query terms; everything else stays on disk.
+MAGIC = b"GIDX\x00\x00\x00\x01"
+
+K1 = 1.2
+B = 0.75
+
+# Guideline references such as B3-3.1-05 or B3-3.1
+_REFERENCE = r"[A-E]\d-\d+(?:\.\d+)*(?:-\d+)?"
+SECTION_PATTERN = re.compile(rf"\b{_REFERENCE}\b")
+# Headings opening a chapter, section or topic, at the start of a line:
+# "Chapter A2-1, Title", "Section A2-3.1, Title" or "A2-1-01, Title (02/05/2025)".
+# A topic title may wrap onto a second line before its date, or be cut off where
+# the text ends (a chunk boundary, or a page's, where only the "Published <date>"
+# footer and page number follow) as long as it doesn't end a sentence.
+# References inside sentences ("as described in A2-2-07, ...") aren't headings,
+# even when the sentence wraps so that one starts a line.
+HEADING_PATTERN = re.compile(
+    rf"^(?:(?:Chapter|Section) (?P<part>{_REFERENCE}), .*"
+    rf"|(?P<topic>{_REFERENCE}), [^\n]*(?:\n[^\n]*)?\(\d\d/\d\d/\d{{4}}\)[ \t]*$"
+    rf"|(?P<cut>{_REFERENCE}), [^\n.;()]*(?:\n[^\n.;()]*)?(?:\nPublished [^\n]*\n\d+)?\s*\Z)",
+    re.MULTILINE
+)
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have if in into is it its of on or that the
+their this to was were will with may must not any all such other than which who
+""".split())
+
+
+def tokenize(text):
+    text = text.lower()
+    tokens = [token for token in TOKEN_PATTERN.findall(text) if token not in STOPWORDS]
+    # Keep section references whole so "B3-3.1-05" can be looked up directly
+    tokens.extend(ref.lower() for ref in SECTION_PATTERN.findall(text.upper()))
+    return tokens
+
+
+def section_headings(text):
+    """References of the headings in text (see HEADING_PATTERN), in order."""
+    return [match.group("part") or match.group("topic") or match.group("cut") for match in HEADING_PATTERN.finditer(text)]
+
+
+def _pad(f):
+    f.write(b"\0" * (-f.tell() % 8))
+
+
+def build_index(chunks, path):
+    """Build a BM25 index over chunks ({"text", "metadata"} dicts) and write it to path.
+
+    Each chunk is tagged with its metadata's "section" or, failing that, the
+    first section heading in it or else the last one seen before it, so results
+    can be cited even when the chunk itself only holds part of a paragraph.
+    Only headings count (see section_headings), not references made in the
+    text. chunks may be any iterable, e.g. records streamed from a JSONL file.
+    """
+    postings = {}
+    lengths = array("I")
+    records = []
+    section = None
+    for chunk_id, chunk in enumerate(chunks):
+        text = chunk["text"]
+        metadata = chunk.get("metadata", {})
+        headings = section_headings(text)
+        record = {"text": text, "section": metadata.get("section") or (headings[0] if headings else section), "metadata": metadata}
+        if headings:
+            section = headings[-1]
+        records.append(json.dumps(record, separators=(",", ":")).encode("utf-8"))
+
+        tokens = tokenize(text)
+        lengths.append(len(tokens))
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for token, tf in counts.items():
+            postings.setdefault(token, []).append((chunk_id, tf))
+
+    vocabulary = {}
+    flat = array("I")
+    for term in sorted(postings):
+        vocabulary[term] = (len(flat) // 2, len(postings[term]))
+        for chunk_id, tf in postings[term]:
+            flat.extend((chunk_id, tf))
+
+    offsets = array("Q", [0])
+    for record in records:
+        offsets.append(offsets[-1] + len(record))
+
+    if sys.byteorder != "little":
+        for values in (flat, lengths, offsets):
+            values.byteswap()
+
+    header = {
+        "chunks": len(records),
+        "average_length": (sum(lengths) / len(lengths)) if lengths else 0.0,
+        "postings": len(flat) // 2,
+        "vocabulary": vocabulary,
+        # Identifies the index contents, e.g. for cache keys of prompts built from it
+        "version": hashlib.sha256(b"".join(records)).hexdigest()[:16]
+    }
+    encoded = json.dumps(header, separators=(",", ":")).encode("utf-8")
+
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(encoded)))
+        f.write(encoded)
+        _pad(f)
+        flat.tofile(f)
+        lengths.tofile(f)
+        _pad(f)
+        offsets.tofile(f)
+        for record in records:
+            f.write(record)
+    os.replace(temp_path, path)
+    return path
+
+
+class GuidelineIndex:
+    """Read-only BM25 index over guideline chunks, memory-mapped from disk."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:8] != MAGIC:
+            raise ValueError(f"{path} is not a guideline index")
+        if sys.byteorder != "little":
+            raise ValueError("Guideline indexes can only be read on little-endian machines")
+
+        header_length = struct.unpack_from("<Q", self._map, 8)[0]
+        header = json.loads(self._map[16:16 + header_length])
+        self.chunk_count = header["chunks"]
+        self.average_length = header["average_length"]
+        self.version = header["version"]
+        self._vocabulary = header["vocabulary"]
+
+        view = memoryview(self._map)
+        start = 16 + header_length
+        start += -start % 8
+        end = start + header["postings"] * 8
+        self._postings = view[start:end].cast("I")
+        self._lengths = view[end:end + self.chunk_count * 4].cast("I")
+        start = end + self.chunk_count * 4
+        start += -start % 8
+        end = start + (self.chunk_count + 1) * 8
+        self._offsets = view[start:end].cast("Q")
+        self._records = end
+
+    def chunk(self, chunk_id):
+        start = self._records + self._offsets[chunk_id]
+        end = self._records + self._offsets[chunk_id + 1]
+        return json.loads(self._map[start:end])
+
+    def search(self, query, k=5):
+        """Top-k chunks for a free-text query, best first, each with its BM25 score."""
+        scores = {}
+        for term in set(tokenize(query)):
+            entry = self._vocabulary.get(term)
+            if entry is None:
+                continue
+            first, df = entry
+            idf = math.log(1 + (self.chunk_count - df + 0.5) / (df + 0.5))
+            for i in range(first * 2, (first + df) * 2, 2):
+                chunk_id = self._postings[i]
+                tf = self._postings[i + 1]
+                norm = K1 * (1 - B + B * self._lengths[chunk_id] / self.average_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+
+        results = []
+        for chunk_id, score in heapq.nlargest(k, scores.items(), key=lambda item: item[1]):
+            record = self.chunk(chunk_id)
+            record["chunk_id"] = chunk_id
+            record["score"] = round(score, 4)
+            results.append(record)
+        return results
+
+
+def build_query(paystub_data, borrower_data):
+    """Describe the application in guideline vocabulary to retrieve the relevant sections."""
+    paystub_data = paystub_data or {}
+    borrower_data = borrower_data or {}
+    income_type = borrower_data.get("income_type") or borrower_data.get("employment_type") or "Salaried"
+    terms = [
+        "base pay", f"{income_type} income", "employment income verification",
+        "paystub", "year-to-date earnings", "calculating qualifying income"
+    ]
+    if paystub_data.get("pay_frequency"):
+        terms.append(f"{paystub_data['pay_frequency']} pay frequency")
+    if paystub_data.get("hours") or paystub_data.get("rate"):
+        terms.append("hourly hours worked")
+    text = (paystub_data.get("raw_text") or paystub_data.get("text") or "").lower()
+    for keyword in ("overtime", "bonus", "commission", "tips"):
+        if keyword in text:
+            terms.append(f"{keyword} income variable")
+    if borrower_data.get("stated_income"):
+        terms.append("stated income documentation")
+    return " ".join(terms)
@@ -0,0 +1,273 @@
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+
+# Statuses a job moves through: queued -> running -> succeeded | failed. A failed
+# attempt goes back to queued until max_attempts is reached.
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+# Finished jobs are deleted by purge after this long
+RETENTION_SECONDS = 7 * 24 * 3600
+# How often run_worker purges finished jobs
+PURGE_INTERVAL_SECONDS = 3600
+
+
+class JobFailed(Exception):
+    """Raised by a job handler for an unusable result; the result is kept with the error."""
+
+    def __init__(self, message, result=None):
+        super().__init__(message)
+        self.result = result
+
+
+class JobQueue:
+    """Durable job queue in a SQLite file, shared by the API and any number of worker processes.
+
+    A claimed job is leased for `lease_seconds`; if its worker dies the lease
+    runs out and another worker picks the job up again, so a restart doesn't
+    lose in-flight work. A worker still running renews its lease, and
+    complete, fail and renew take the attempt number returned by claim as a
+    lease token: once another worker has re-claimed the job, the stale worker's
+    updates are ignored. Jobs submitted with an idempotency key that was
+    already used return the existing job instead of queueing a new one.
+
+    The uploaded PDF is dropped once a job has finished, and finished jobs
+    are deleted after `retention_seconds` (None keeps them), which also
+    forgets their idempotency keys.
+    """
+
+    def __init__(self, path, lease_seconds=300, max_attempts=3, retry_delay=2.0, retention_seconds=RETENTION_SECONDS):
+        self.path = path
+        self.retention_seconds = retention_seconds
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Autocommit mode; transactions are opened explicitly with BEGIN IMMEDIATE
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                idempotency_key TEXT UNIQUE,
+                status TEXT NOT NULL,
+                filename TEXT,
+                pdf BLOB NOT NULL,
+                borrower TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                available_at REAL NOT NULL,
+                lease_expires_at REAL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, available_at)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (status, updated_at)")
+
+    def _transaction(self, work):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                value = work()
+                self._db.execute("COMMIT")
+                return value
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def enqueue(self, pdf, borrower_data, filename=None, idempotency_key=None):
+        """Queue a job; returns (job id, created). created is False when the idempotency key was seen before."""
+        now = time.time()
+
+        def work():
+            if idempotency_key is not None:
+                row = self._db.execute("SELECT id FROM jobs WHERE idempotency_key = ?", (idempotency_key,)).fetchone()
+                if row:
+                    return row[0], False
+            job_id = uuid.uuid4().hex
+            self._db.execute(
+                "INSERT INTO jobs (id, idempotency_key, status, filename, pdf, borrower, created_at, updated_at, available_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, idempotency_key, QUEUED, filename, pdf, json.dumps(borrower_data), now, now, now)
+            )
+            return job_id, True
+
+        return self._transaction(work)
+
+    def claim(self):
+        """Lease the oldest runnable job and return it, or None if there is nothing to do.
+
+        Runnable means queued and due, or running with an expired lease.
+        """
+        now = time.time()
+
+        def work():
+            while True:
+                row = self._db.execute(
+                    "SELECT id, filename, pdf, borrower, attempts, status FROM jobs "
+                    "WHERE (status = ? AND available_at <= ?) OR (status = ? AND lease_expires_at < ?) "
+                    "ORDER BY available_at LIMIT 1",
+                    (QUEUED, now, RUNNING, now)
+                ).fetchone()
+                if row is None:
+                    return None
+                if row[5] != RUNNING or row[4] < self.max_attempts:
+                    break
+                # A job that keeps taking its worker down is not retried forever
+                self._db.execute(
+                    "UPDATE jobs SET status = ?, error = ?, pdf = X'', lease_expires_at = NULL, updated_at = ? WHERE id = ?",
+                    (FAILED, f"Worker lost the job on all {row[4]} attempts", now, row[0])
+                )
+            self._db.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, lease_expires_at = ?, updated_at = ? WHERE id = ?",
+                (RUNNING, now + self.lease_seconds, now, row[0])
+            )
+            return {"id": row[0], "filename": row[1], "pdf": row[2], "borrower_data": json.loads(row[3]), "attempt": row[4] + 1}
+
+        return self._transaction(work)
+
+    def _holds_lease(self, job_id, attempt):
+        return self._db.execute(
+            "SELECT 1 FROM jobs WHERE id = ? AND attempts = ? AND status = ?", (job_id, attempt, RUNNING)
+        ).fetchone() is not None
+
+    def renew(self, job_id, attempt):
+        """Extend the lease of a running job; False if the lease was lost to another worker."""
+        now = time.time()
+        cursor = self._transaction(lambda: self._db.execute(
+            "UPDATE jobs SET lease_expires_at = ?, updated_at = ? WHERE id = ? AND attempts = ? AND status = ?",
+            (now + self.lease_seconds, now, job_id, attempt, RUNNING)
+        ))
+        return cursor.rowcount > 0
+
+    def complete(self, job_id, attempt, result):
+        """Record the result of the attempt; False if the lease was lost and the result was dropped."""
+        now = time.time()
+        cursor = self._transaction(lambda: self._db.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = NULL, pdf = X'', lease_expires_at = NULL, updated_at = ? "
+            "WHERE id = ? AND attempts = ? AND status = ?",
+            (SUCCEEDED, json.dumps(result), now, job_id, attempt, RUNNING)
+        ))
+        return cursor.rowcount > 0
+
+    def fail(self, job_id, attempt, error, result=None):
+        """Record a failed attempt; the job is retried with jittered backoff until max_attempts.
+
+        Returns the job's new status, or None if the lease was lost and nothing was recorded.
+        """
+        now = time.time()
+
+        def work():
+            if not self._holds_lease(job_id, attempt):
+                return None
+            if attempt < self.max_attempts:
+                delay = random.uniform(0, self.retry_delay * 2 ** (attempt - 1))
+                status, available_at = QUEUED, now + delay
+            else:
+                status, available_at = FAILED, now
+            self._db.execute(
+                "UPDATE jobs SET status = ?, error = ?, result = ?, available_at = ?, lease_expires_at = NULL, updated_at = ? WHERE id = ?",
+                (status, error, json.dumps(result) if result is not None else None, available_at, now, job_id)
+            )
+            if status == FAILED:
+                # Not retried again; the upload is no longer needed
+                self._db.execute("UPDATE jobs SET pdf = X'' WHERE id = ?", (job_id,))
+            return status
+
+        return self._transaction(work)
+
+    def purge(self, older_than=None):
+        """Delete jobs that finished more than `older_than` seconds ago (default retention_seconds); returns how many."""
+        older_than = self.retention_seconds if older_than is None else older_than
+        if older_than is None:
+            return 0
+        cursor = self._transaction(lambda: self._db.execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+            (SUCCEEDED, FAILED, time.time() - older_than)
+        ))
+        return cursor.rowcount
+
+    def get(self, job_id):
+        """Status of a job without its payload, or None if there is no such job."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, status, filename, attempts, result, error, created_at, updated_at FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row[0],
+            "status": row[1],
+            "filename": row[2],
+            "attempts": row[3],
+            "result": json.loads(row[4]) if row[4] else None,
+            "error": row[5],
+            "created_at": row[6],
+            "updated_at": row[7]
+        }
+
+    def counts(self):
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {QUEUED: 0, RUNNING: 0, SUCCEEDED: 0, FAILED: 0}
+        counts.update(dict(rows))
+        return counts
+
+
+async def _keep_leased(queue, job):
+    """Renew the job's lease every third of lease_seconds while its handler runs."""
+    while True:
+        await asyncio.sleep(queue.lease_seconds / 3)
+        if not await asyncio.to_thread(queue.renew, job["id"], job["attempt"]):
+            print(f"Job {job['id']} attempt {job['attempt']} lost its lease; its result will be dropped")
+            return
+
+
+async def run_worker(queue, handler, poll_interval=0.5, stop=None):
+    """Claim and run jobs with `handler(job)` until `stop` (an asyncio.Event) is set.
+
+    handler is a coroutine function returning the job's result; an exception
+    counts as a failed attempt (raise JobFailed to keep a partial result).
+    The lease is renewed while the handler runs, so jobs may take longer than
+    lease_seconds. Finished jobs past the queue's retention are purged every
+    PURGE_INTERVAL_SECONDS. SQLite calls run in a thread so other workers and
+    requests on the event loop aren't held up.
+    """
+    next_purge = 0
+    while stop is None or not stop.is_set():
+        if queue.retention_seconds is not None and time.monotonic() >= next_purge:
+            next_purge = time.monotonic() + PURGE_INTERVAL_SECONDS
+            purged = await asyncio.to_thread(queue.purge)
+            if purged:
+                print(f"Purged {purged} finished jobs older than {queue.retention_seconds:.0f}s")
+        job = await asyncio.to_thread(queue.claim)
+        if job is None:
+            await asyncio.sleep(poll_interval)
+            continue
+        heartbeat = asyncio.create_task(_keep_leased(queue, job))
+        try:
+            result = await handler(job)
+        except asyncio.CancelledError:
+            # Shutting down; the lease expires and another worker takes the job
+            raise
+        except Exception as e:
+            result = e.result if isinstance(e, JobFailed) else None
+            status = await asyncio.to_thread(queue.fail, job["id"], job["attempt"], str(e), result)
+            print(f"Job {job['id']} attempt {job['attempt']} failed ({status or 'lease lost'}): {e}")
+            continue
+        finally:
+            heartbeat.cancel()
+        if not await asyncio.to_thread(queue.complete, job["id"], job["attempt"], result):
+            print(f"Job {job['id']} attempt {job['attempt']} finished after losing its lease; result dropped")
@@ -0,0 +1,19 @@
+import argparse
+import asyncio
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import job_queue, underwrite_job
+from scripts.job_queue import run_worker
+
+
+async def main(workers):
+    print(f"Processing jobs from {job_queue.path} with {workers} workers...")
+    await asyncio.gather(*(run_worker(job_queue, underwrite_job) for _ in range(workers)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Process queued underwriting jobs (see POST /jobs).")
+    parser.add_argument("--workers", type=int, default=4, help="Jobs processed at once.")
+    args = parser.parse_args()
+    asyncio.run(main(args.workers))
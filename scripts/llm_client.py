@@ -0,0 +1,230 @@
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+from dotenv import load_dotenv
+import openai
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.prompt_builder import count_tokens
+from scripts import metrics
+
+load_dotenv()
+
+# Shared OpenAI clients for the API, the Streamlit app and the scripts. Set
+# OPENAI_BASE_URL to point them at another endpoint, e.g. a local mock server.
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "64"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "32"))
+# Retries on 429, 5xx, timeouts and dropped connections, with full-jitter backoff
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "5"))
+OPENAI_BACKOFF_BASE = float(os.getenv("OPENAI_BACKOFF_BASE", "0.5"))
+OPENAI_BACKOFF_MAX = float(os.getenv("OPENAI_BACKOFF_MAX", "30"))
+# Account limits for MODEL; requests are held back client-side so bursts don't hit
+# the server's limits. 0 disables a limit.
+OPENAI_RPM_LIMIT = float(os.getenv("OPENAI_RPM_LIMIT", "500"))
+OPENAI_TPM_LIMIT = float(os.getenv("OPENAI_TPM_LIMIT", "30000"))
+# SQLite file holding the limits' balances, so every process on the host (API
+# workers, job workers, batch runs) shares one budget; empty keeps it per process.
+OPENAI_RATE_LIMIT_PATH = os.getenv("OPENAI_RATE_LIMIT_PATH", ".cache/openai_rate_limit.sqlite3")
+# Longest a request waits for the limits before failing instead
+OPENAI_MAX_THROTTLE_WAIT = float(os.getenv("OPENAI_MAX_THROTTLE_WAIT", "30"))
+
+api_key = os.getenv("OPENAI_API_KEY")
+
+
+class ThrottledError(RuntimeError):
+    """The client-side rate limits would hold the request back longer than OPENAI_MAX_THROTTLE_WAIT."""
+
+
+class RateLimiter:
+    """Per-minute limits as token buckets refilled continuously at limit/60 per second, up to limit.
+
+    reserve() takes from every bucket at once, letting the balances go
+    negative, and returns how long the caller has to wait before its share is
+    actually available; callers are served in the order they reserve. With a
+    path the balances live in a SQLite file shared by every process using it;
+    without one they are kept in this process.
+    """
+
+    def __init__(self, limits, path=None):
+        self.limits = {name: limit for name, limit in limits.items() if limit > 0}
+        self._state = {}
+        self._lock = threading.Lock()
+        self._db = None
+        if path and self.limits:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            # Autocommit mode; each reservation is one BEGIN IMMEDIATE transaction
+            self._db = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)")
+
+    def _take(self, state, amounts, max_wait):
+        now = time.time()
+        balances = {}
+        wait = 0.0
+        for name, limit in self.limits.items():
+            tokens, updated = state.get(name, (limit, now))
+            rate = limit / 60.0
+            tokens = min(limit, tokens + max(0.0, now - updated) * rate)
+            # A request larger than the bucket could never fit; let it through when the bucket is full
+            tokens -= min(amounts.get(name, 0), limit)
+            balances[name] = tokens
+            wait = max(wait, -tokens / rate)
+        if max_wait is not None and wait > max_wait:
+            return None
+        for name, tokens in balances.items():
+            state[name] = (tokens, now)
+        return wait
+
+    def reserve(self, amounts, max_wait=None):
+        """Take amounts ({limit name: amount}) and return the seconds to wait.
+
+        Returns None, taking nothing, when the wait would be over max_wait.
+        """
+        with self._lock:
+            if self._db is None:
+                return self._take(self._state, amounts, max_wait)
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                state = {name: (tokens, updated) for name, tokens, updated in self._db.execute("SELECT name, tokens, updated FROM buckets")}
+                wait = self._take(state, amounts, max_wait)
+                if wait is not None:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                        [(name, *state[name]) for name in self.limits]
+                    )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            return wait
+
+
+rate_limiter = RateLimiter({"requests": OPENAI_RPM_LIMIT, "tokens": OPENAI_TPM_LIMIT}, OPENAI_RATE_LIMIT_PATH or None)
+
+
+def estimate_tokens(params):
+    """Tokens a request counts against the TPM limit: the prompt plus max_tokens."""
+    prompt = sum(count_tokens(str(message.get("content") or "")) for message in params.get("messages", []))
+    if params.get("tools"):
+        prompt += count_tokens(json.dumps(params["tools"]))
+    return prompt + (params.get("max_tokens") or 0)
+
+
+def throttle_delay(params):
+    """Reserve the request's share of the limits; returns the seconds to wait before sending it."""
+    if not rate_limiter.limits:
+        return 0.0
+    delay = rate_limiter.reserve({"requests": 1, "tokens": estimate_tokens(params)}, OPENAI_MAX_THROTTLE_WAIT)
+    if delay is None:
+        metrics.record_error("llm_throttle", ThrottledError())
+        raise ThrottledError(f"Rate limits would hold the request back more than {OPENAI_MAX_THROTTLE_WAIT:.0f}s; try again later")
+    if delay:
+        metrics.STAGE_SECONDS.observe(delay, stage="llm_throttle")
+    return delay
+
+
+def is_retryable(error):
+    if isinstance(error, openai.RateLimitError):
+        # Out of quota is not going to clear up by waiting
+        return getattr(error, "code", None) != "insufficient_quota"
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code >= 500
+    # APITimeoutError is a subclass of APIConnectionError
+    return isinstance(error, openai.APIConnectionError)
+
+
+def retry_delay(error, attempt):
+    """Seconds to wait before the next attempt: Retry-After if the server sent one, else full jitter."""
+    response = getattr(error, "response", None)
+    if response is not None:
+        for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+            value = response.headers.get(header)
+            try:
+                if value is not None:
+                    return min(float(value) * scale, OPENAI_BACKOFF_MAX) + random.uniform(0, OPENAI_BACKOFF_BASE)
+            except ValueError:
+                pass
+    return random.uniform(0, min(OPENAI_BACKOFF_MAX, OPENAI_BACKOFF_BASE * 2 ** attempt))
+
+
+def _client_options():
+    # DEFAULT_CONNECTION_LIMITS is an instance of the HTTP library's Limits class,
+    # whichever library this version of openai is built on
+    limits = type(openai.DEFAULT_CONNECTION_LIMITS)(
+        max_connections=OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=OPENAI_MAX_KEEPALIVE
+    )
+    timeout = openai.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT)
+    return {"limits": limits, "timeout": timeout}
+
+
+client = None
+async_client = None
+
+# Only initialize the clients if the API key is available
+if api_key:
+    # Retries are handled below so they can be throttled and logged like first attempts
+    client = openai.OpenAI(
+        api_key=api_key,
+        base_url=OPENAI_BASE_URL,
+        max_retries=0,
+        http_client=openai.DefaultHttpxClient(**_client_options())
+    )
+    async_client = openai.AsyncOpenAI(
+        api_key=api_key,
+        base_url=OPENAI_BASE_URL,
+        max_retries=0,
+        http_client=openai.DefaultAsyncHttpxClient(**_client_options())
+    )
+else:
+    print("Warning: OPENAI_API_KEY environment variable not set")
+
+
+def chat_completion(**params):
+    """client.chat.completions.create with client-side rate limiting and retries."""
+    if client is None:
+        raise RuntimeError("OpenAI API key not set. Please set the OPENAI_API_KEY environment variable.")
+    attempt = 0
+    while True:
+        delay = throttle_delay(params)
+        if delay:
+            time.sleep(delay)
+        try:
+            return client.chat.completions.create(**params)
+        except Exception as e:
+            if attempt >= OPENAI_MAX_RETRIES or not is_retryable(e):
+                raise
+            delay = retry_delay(e, attempt)
+            attempt += 1
+            metrics.LLM_RETRIES.inc(error=e.__class__.__name__)
+            print(f"OpenAI request failed ({e.__class__.__name__}), retry {attempt}/{OPENAI_MAX_RETRIES} in {delay:.1f}s")
+            time.sleep(delay)
+
+
+async def chat_completion_async(**params):
+    """Same as chat_completion, on the async client; waits without blocking the event loop."""
+    if async_client is None:
+        raise RuntimeError("OpenAI API key not set. Please set the OPENAI_API_KEY environment variable.")
+    attempt = 0
+    while True:
+        # The shared limits are a SQLite transaction and counting tokens is CPU work
+        delay = await asyncio.to_thread(throttle_delay, params)
+        if delay:
+            await asyncio.sleep(delay)
+        try:
+            return await async_client.chat.completions.create(**params)
+        except Exception as e:
+            if attempt >= OPENAI_MAX_RETRIES or not is_retryable(e):
+                raise
+            delay = retry_delay(e, attempt)
+            attempt += 1
+            metrics.LLM_RETRIES.inc(error=e.__class__.__name__)
+            print(f"OpenAI request failed ({e.__class__.__name__}), retry {attempt}/{OPENAI_MAX_RETRIES} in {delay:.1f}s")
+            await asyncio.sleep(delay)
@@ -0,0 +1,181 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# In-process counters and histograms rendered in the Prometheus text format by
+# GET /metrics. Recording is a dict update under a lock, cheap enough to leave on.
+
+# Seconds; covers a cached lookup up to a slow completion
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_registry = []
+
+# Stage durations of the current request, for the Server-Timing header
+_timings = ContextVar("server_timings", default=None)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help):
+        super().__init__(name, help)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        return [f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in self._values.items()]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help):
+        super().__init__(name, help)
+        self._values = {}
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def _samples(self):
+        return [f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in self._values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(buckets)
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # Per-bucket counts (the last one is +Inf), sum, count
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def _samples(self):
+        lines = []
+        for key, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', _format_value(float(bound)))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+HTTP_REQUESTS = Counter("underwriter_http_requests_total", "HTTP requests by route and status code")
+HTTP_SECONDS = Histogram("underwriter_http_request_seconds", "Time to the response headers, by route")
+STAGE_SECONDS = Histogram("underwriter_stage_seconds", "Time spent in each pipeline stage")
+UPLOAD_BYTES = Counter("underwriter_upload_bytes_total", "Bytes of uploaded documents received")
+PDF_PAGES = Counter("underwriter_pdf_pages_total", "PDF pages read, by source (parsed or cached by the layout backend, text)")
+PDF_BACKEND = Counter("underwriter_pdf_backend_total", "Paystubs by the PDF backend whose extraction was used")
+COALESCED_UNDERWRITES = Counter("underwriter_coalesced_underwrites_total", "Underwrites that joined an identical one already running")
+EVALUATIONS = Counter("underwriter_evaluations_total", "Income evaluations by how they were answered (rules, cache, llm, error)")
+LLM_TOKENS = Counter("underwriter_llm_tokens_total", "Tokens used by model calls, by kind (prompt or completion)")
+LLM_RETRIES = Counter("underwriter_llm_retries_total", "Retried model calls, by error class")
+ERRORS = Counter("underwriter_errors_total", "Errors by stage and error class")
+CACHE_ENTRIES = Gauge("underwriter_cache_entries", "Entries in each cache, by cache and tier")
+CACHE_LOOKUPS = Gauge("underwriter_cache_lookups", "Cache lookups since start, by cache and outcome")
+CACHE_EVICTIONS = Gauge("underwriter_cache_evictions", "Cache entries evicted since start, by cache and tier")
+JOBS = Gauge("underwriter_jobs", "Jobs in the queue by status")
+
+
+def start_request():
+    """Collect the stage timings of the current request (call at the start of each request)."""
+    timings = {}
+    _timings.set(timings)
+    return timings
+
+
+@contextmanager
+def stage(name):
+    """Time a pipeline stage into STAGE_SECONDS and the current request's Server-Timing."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        STAGE_SECONDS.observe(seconds, stage=name)
+        timings = _timings.get()
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + seconds
+
+
+def record_error(stage_name, error):
+    ERRORS.inc(stage=stage_name, error=error.__class__.__name__)
+
+
+def server_timing(timings):
+    """Server-Timing header value, e.g. 'pdf_parse;dur=84.1, llm;dur=912.3'."""
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
+
+
+def record_cache(name, cache):
+    """Copy a ResultCache's stats into the cache gauges."""
+    stats = cache.stats()
+    CACHE_ENTRIES.set(stats["memory_entries"], cache=name, tier="memory")
+    if "disk_entries" in stats:
+        CACHE_ENTRIES.set(stats["disk_entries"], cache=name, tier="disk")
+    for outcome in ("memory_hits", "disk_hits", "misses"):
+        CACHE_LOOKUPS.set(stats[outcome], cache=name, outcome=outcome)
+    CACHE_EVICTIONS.set(stats["memory_evictions"], cache=name, tier="memory")
+    if "disk_entries" in stats:
+        CACHE_EVICTIONS.set(stats["disk_evictions"], cache=name, tier="disk")
@@ -1,51 +1,179 @@
-import pdfplumber
 import sys
+import os
 import json
-from datetime import datetime
+import pypdfium2 as pdfium
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.pdf_text import iter_page_texts, read_pdf
+from scripts.pdf_engine import pdfium_lock
+from scripts.field_extraction import extract_fields
+from scripts.rules_engine import REQUIRED_FIELDS, RULES_MIN_CONFIDENCE, VARIABLE_INCOME
+from scripts import metrics
 
-def extract_fields_from_pdf(pdf_path):
-    with pdfplumber.open(pdf_path) as pdf:
-        text = "\n".join(page.extract_text() for page in pdf.pages if page.extract_text())
+# Most documents are scanned only until the required fields turn up (page 1 of
+# a paystub); this caps the pages scanned when they don't. 0 means no cap.
+PDF_MAX_SCAN_PAGES = int(os.getenv("PDF_MAX_SCAN_PAGES", "0"))
+
+def _page_text(document, index):
+    with pdfium_lock:
+        page = document[index]
+        textpage = page.get_textpage()
+        try:
+            return textpage.get_text_range().replace("\r\n", "\n")
+        finally:
+            textpage.close()
+            page.close()
+
+def text_backend(source):
+    """Text layer only, via PDFium: milliseconds per page but no layout analysis.
+
+    PDFium isn't thread-safe, so each call holds pdf_engine.pdfium_lock; it is
+    released between pages so other threads' documents interleave. Pages read
+    are counted in underwriter_pdf_pages_total as source="text" (the layout
+    backend's are counted as parsed or cached by pdf_text).
+    """
+    data = read_pdf(source)
+    with pdfium_lock:
+        document = pdfium.PdfDocument(data)
+        count = len(document)
+    try:
+        for index in range(count):
+            text = _page_text(document, index)
+            metrics.PDF_PAGES.inc(source="text")
+            yield text
+    finally:
+        with pdfium_lock:
+            document.close()
+
+def layout_backend(source):
+    """pdfplumber's layout analysis through the page text cache, one page first, then growing batches."""
+    for _, text in iter_page_texts(source, first_batch_pages=1):
+        yield text
+
+# Page text generators by name, each taking PDF bytes or a path and yielding
+# the text of one page at a time, so scanning can stop early.
+BACKENDS = {
+    "text": text_backend,
+    "layout": layout_backend
+}
+# Backends tried in order until one yields every field the rules engine needs
+PDF_BACKENDS = [name.strip() for name in os.getenv("PDF_BACKENDS", "text,layout").split(",") if name.strip()]
+
+def paystub_fields(text):
+    """Paystub fields extracted from the text of a paystub."""
+    found, confidence = extract_fields(text)
 
     fields = {
         "gross_pay_per_period": None,
         "ytd_income": None,
-        "pay_frequency": "Biweekly",  # default assumption
+        "net_pay": None,
+        "hours": None,
+        "rate": None,
+        "pay_frequency": None,
         "pay_period_start": None,
         "pay_period_end": None,
+        "pay_date": None,
         "employer_name": None,
-        "raw_text": text[:1000]  # helpful for GPT context
     }
+    fields.update(found)
+    # Per-field confidence between 0 and 1; fields that weren't found are absent
+    fields["confidence"] = confidence
+    # Checked on the whole text: an overtime or bonus line can come after the excerpt below
+    fields["variable_income"] = bool(VARIABLE_INCOME.search(text))
+    fields["raw_text"] = text[:1000]  # helpful for GPT context
 
-    # Basic regex-free parsing (real implementation would be more robust)
-    lines = text.splitlines()
-    for line in lines:
-        if "gross" in line.lower() and "$" in line:
-            try:
-                fields["gross_pay_per_period"] = float(line.replace("$", "").split()[-1].replace(",", ""))
-            except:
-                pass
-        if "ytd" in line.lower() and "$" in line:
-            try:
-                fields["ytd_income"] = float(line.replace("$", "").split()[-1].replace(",", ""))
-            except:
-                pass
-        if "period" in line.lower() and "-" in line:
-            parts = line.split()
-            for part in parts:
-                if "/" in part:
-                    try:
-                        if fields["pay_period_start"] is None:
-                            fields["pay_period_start"] = str(datetime.strptime(part, "%m/%d/%Y").date())
-                        elif fields["pay_period_end"] is None:
-                            fields["pay_period_end"] = str(datetime.strptime(part, "%m/%d/%Y").date())
-                    except:
-                        continue
-        if "employer" in line.lower():
-            fields["employer_name"] = line.split(":")[-1].strip()
+    return fields
 
+def missing_fields(fields):
+    return [field for field in REQUIRED_FIELDS if fields.get(field) is None]
+
+def scan_pages(pages, max_pages=None):
+    """Paystub fields from page texts, reading pages only until they are needed.
+
+    Each page is checked as it arrives; once every required field has been
+    seen with RULES_MIN_CONFIDENCE, or max_pages (default PDF_MAX_SCAN_PAGES)
+    pages were read, the rest of the document is never extracted. The fields
+    are then extracted from the pages read, taken together.
+    """
+    max_pages = PDF_MAX_SCAN_PAGES if max_pages is None else max_pages
+    texts = []
+    found = set()
+    pages = iter(pages)
+    try:
+        for text in pages:
+            texts.append(text)
+            page_fields, confidence = extract_fields(text)
+            found.update(field for field in REQUIRED_FIELDS if field in page_fields and confidence[field] >= RULES_MIN_CONFIDENCE)
+            if len(found) == len(REQUIRED_FIELDS) or (max_pages and len(texts) >= max_pages):
+                break
+    finally:
+        # Release the backend's open document now rather than when the generator is collected
+        if hasattr(pages, "close"):
+            pages.close()
+    fields = paystub_fields("\n".join(text for text in texts if text))
+    fields["pages_scanned"] = len(texts)
     return fields
 
+def extract_fields_from_pdf(pdf_path, backends=None, max_pages=None):
+    """Paystub fields of a PDF (path or bytes), trying the backends in order.
+
+    The next backend is only tried when the previous one fails or leaves a
+    required field missing; if none finds them all, the attempt that found the
+    most fields is returned. fields["backend"] names the backend that served it
+    and fields["pages_scanned"] how many pages it read (see scan_pages).
+    """
+    backends = backends or PDF_BACKENDS
+    data = read_pdf(pdf_path)
+    best = None
+    for position, name in enumerate(backends):
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown PDF backend {name!r}; choose from {', '.join(BACKENDS)}")
+        try:
+            fields = scan_pages(BACKENDS[name](data), max_pages)
+        except Exception as e:
+            if position == len(backends) - 1 and best is None:
+                raise
+            metrics.record_error(f"pdf_{name}", e)
+            continue
+        fields["backend"] = name
+        if best is None or len(missing_fields(fields)) <= len(missing_fields(best)):
+            best = fields
+        if not missing_fields(fields):
+            break
+    metrics.PDF_BACKEND.inc(backend=best["backend"])
+    return best
+
+def extract_document_pages(source, backends=None):
+    """Text of every page of a PDF (path or bytes) and the paystub fields of it all, as (pages, fields).
+
+    For documents kept whole (sidecars, the reviewer's document texts). The
+    backends are tried in order like in extract_fields_from_pdf, except that a
+    document without pay amounts (a W-2, a bank statement, the guide) is taken
+    from the first backend: only a paystub missing some fields is worth
+    another backend's layout analysis. fields["backend"] names the backend
+    whose pages are returned.
+    """
+    backends = backends or PDF_BACKENDS
+    data = read_pdf(source)
+    best = None
+    for position, name in enumerate(backends):
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown PDF backend {name!r}; choose from {', '.join(BACKENDS)}")
+        try:
+            pages = list(BACKENDS[name](data))
+        except Exception as e:
+            if position == len(backends) - 1 and best is None:
+                raise
+            metrics.record_error(f"pdf_{name}", e)
+            continue
+        fields = paystub_fields("\n".join(text for text in pages if text))
+        fields["backend"] = name
+        if best is None or len(missing_fields(fields)) < len(missing_fields(best[1])):
+            best = (pages, fields)
+        if not missing_fields(fields) or (fields["gross_pay_per_period"] is None and fields["ytd_income"] is None):
+            break
+    metrics.PDF_BACKEND.inc(backend=best[1]["backend"])
+    return best
+
 if __name__ == "__main__":
     pdf_path = sys.argv[1]
     fields = extract_fields_from_pdf(pdf_path)
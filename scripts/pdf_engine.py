@@ -0,0 +1,208 @@
+import io
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor, CancelledError
+from concurrent.futures.process import BrokenProcessPool
+import pdfplumber
+import pypdfium2 as pdfium
+
+# pdfplumber layout analysis is pure Python and CPU-bound, so large jobs are spread
+# over a pool of processes. Small jobs (a one or two page paystub) stay in-process
+# because starting and feeding workers would cost more than the parsing itself.
+PDF_POOL_WORKERS = int(os.getenv("PDF_POOL_WORKERS", str(os.cpu_count() or 1)))
+PDF_POOL_MIN_PAGES = int(os.getenv("PDF_POOL_MIN_PAGES", "8"))
+PDF_POOL_PAGES_PER_TASK = int(os.getenv("PDF_POOL_PAGES_PER_TASK", "16"))
+# Workers are recycled after this many tasks and limited to this much address space,
+# so a pathological document can't grow a worker without bound
+PDF_POOL_MAX_TASKS_PER_CHILD = int(os.getenv("PDF_POOL_MAX_TASKS_PER_CHILD", "64"))
+PDF_POOL_MEMORY_LIMIT_MB = int(os.getenv("PDF_POOL_MEMORY_LIMIT_MB", "1024"))
+
+_pool = None
+_pool_lock = threading.Lock()
+# PDFium isn't thread-safe: every pypdfium2 call in this process, from any thread
+# (the API's parse pool, the fetch and intake executors, batch workers), goes
+# through this lock. Hold it per call, not across a whole document.
+pdfium_lock = threading.Lock()
+
+
+class WorkerCrashed(RuntimeError):
+    """A PDF killed the worker parsing it, most likely by running into PDF_POOL_MEMORY_LIMIT_MB."""
+
+
+def _init_worker(memory_limit_mb):
+    if not memory_limit_mb:
+        return
+    try:
+        import resource
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ImportError, ValueError, OSError):
+        # Not available on this platform; max_tasks_per_child still recycles workers
+        pass
+
+
+def _extract_indices(data, indices):
+    """Extract the text of the given pages of one PDF (all pages if indices is None), in order."""
+    texts = []
+    with pdfplumber.open(io.BytesIO(data)) as pdf:
+        for i in range(len(pdf.pages)) if indices is None else indices:
+            page = pdf.pages[i]
+            texts.append(page.extract_text() or "")
+            # Drop the parsed layout objects so long documents don't pile up in memory
+            page.close()
+    return texts
+
+
+def _new_pool(workers):
+    kwargs = {}
+    if sys.version_info >= (3, 11):
+        kwargs["max_tasks_per_child"] = PDF_POOL_MAX_TASKS_PER_CHILD
+    # spawn rather than fork: the API and Streamlit processes run threads
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(PDF_POOL_MEMORY_LIMIT_MB,),
+        **kwargs
+    )
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = _new_pool(PDF_POOL_WORKERS)
+        return _pool
+
+
+def _reset_pool(broken=None):
+    """Shut the pool down; with broken, only if the current pool is still that one."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None and (broken is None or _pool is broken):
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def shutdown():
+    _reset_pool()
+
+
+def page_count(data):
+    # PDFium only reads the page tree, so counting doesn't cost a pdfplumber parse
+    with pdfium_lock:
+        document = pdfium.PdfDocument(data)
+        try:
+            return len(document)
+        finally:
+            document.close()
+
+
+def _in_process(jobs, return_exceptions):
+    results = []
+    for data, indices in jobs:
+        try:
+            results.append(_extract_indices(data, indices))
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            results.append(e)
+    return results
+
+
+def _run_isolated(tasks):
+    """Run (pdf bytes, page indices) tasks one at a time in a single capped worker.
+
+    A task that kills the worker gets WorkerCrashed as its outcome and the
+    next task gets a fresh worker, so one bad document can't take the others
+    down with it or run unbounded in the calling process.
+    """
+    outcomes = []
+    pool = None
+    try:
+        for data, indices in tasks:
+            if pool is None:
+                pool = _new_pool(1)
+            try:
+                outcomes.append(pool.submit(_extract_indices, data, indices).result())
+            except BrokenProcessPool:
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = None
+                outcomes.append(WorkerCrashed("The PDF worker died parsing this document (over the memory limit?)"))
+            except Exception as e:
+                outcomes.append(e)
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=False)
+    return outcomes
+
+
+def extract_pages(jobs, return_exceptions=False):
+    """Extract page text for a list of (pdf bytes, page indices) jobs.
+
+    Returns one list of texts per job, in the same order as the job's indices;
+    indices of None means every page of that PDF. With return_exceptions=True a
+    job that fails yields its exception instead of raising, so one broken upload
+    doesn't sink the others. When a worker dies, the pool's unfinished tasks are
+    retried one by one in a fresh capped worker and a job whose task kills that
+    too fails with WorkerCrashed; nothing is re-parsed in this process.
+    """
+    if PDF_POOL_WORKERS <= 1:
+        return _in_process(jobs, return_exceptions)
+
+    # Only count pages when the pool might be used; PDFium counts them without parsing
+    counted = []
+    for data, indices in jobs:
+        if indices is None:
+            try:
+                indices = list(range(page_count(data)))
+            except Exception:
+                # Let the parsing step report the error for this job
+                indices = [0]
+        counted.append((data, indices))
+    if sum(len(indices) for _, indices in counted) < PDF_POOL_MIN_PAGES:
+        return _in_process(jobs, return_exceptions)
+    jobs = counted
+
+    # Split every job into runs of consecutive pages so each task opens the PDF once
+    tasks = []
+    for job_index, (data, indices) in enumerate(jobs):
+        for start in range(0, len(indices), PDF_POOL_PAGES_PER_TASK):
+            tasks.append((job_index, data, indices[start:start + PDF_POOL_PAGES_PER_TASK]))
+
+    outcomes = [None] * len(tasks)
+    unfinished = []
+    pool = _get_pool()
+    try:
+        futures = [pool.submit(_extract_indices, data, indices) for _, data, indices in tasks]
+    except BrokenProcessPool:
+        # The shared pool broke under another caller; go straight to the retry below
+        futures = []
+        unfinished = list(range(len(tasks)))
+    for position, future in enumerate(futures):
+        try:
+            outcomes[position] = future.result()
+        except (BrokenProcessPool, CancelledError):
+            # Cancelled when another caller reset the broken pool
+            unfinished.append(position)
+        except Exception as e:
+            outcomes[position] = e
+    if unfinished:
+        print(f"Warning: PDF worker pool broke; retrying {len(unfinished)} tasks one at a time in a fresh worker")
+        _reset_pool(pool)
+        for position, outcome in zip(unfinished, _run_isolated([tasks[position][1:] for position in unfinished])):
+            outcomes[position] = outcome
+
+    results = [[] for _ in jobs]
+    for (job_index, _, _), outcome in zip(tasks, outcomes):
+        if isinstance(results[job_index], Exception):
+            continue
+        if isinstance(outcome, Exception):
+            if not return_exceptions:
+                raise outcome
+            results[job_index] = outcome
+        else:
+            results[job_index].extend(outcome)
+    return results
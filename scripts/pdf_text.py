@@ -0,0 +1,137 @@
+import hashlib
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.result_cache import ResultCache
+from scripts.pdf_engine import extract_pages, page_count
+from scripts import metrics
+
+# Per-page text keyed by the SHA-256 of the PDF bytes and the page index. Layout
+# analysis is the most expensive step we have, so re-submitted documents skip it.
+# Set PAGE_TEXT_CACHE_PATH to an empty string to keep the cache in memory only.
+page_cache = ResultCache(
+    path=os.getenv("PAGE_TEXT_CACHE_PATH", ".cache/page_text.sqlite3") or None,
+    ttl=float(os.getenv("PAGE_TEXT_CACHE_TTL", str(30 * 24 * 3600))),
+    max_memory_entries=int(os.getenv("PAGE_TEXT_CACHE_MEMORY_ENTRIES", "4096")),
+    max_disk_bytes=int(os.getenv("PAGE_TEXT_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+)
+
+
+def read_pdf(source):
+    """Return the bytes of a PDF given either its bytes or a path."""
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    with open(source, "rb") as f:
+        return f.read()
+
+
+def pdf_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _page_key(digest, index):
+    return f"{digest}:{index}"
+
+
+def _count_key(digest):
+    return f"{digest}:pages"
+
+
+def extract_documents_page_texts(sources, return_exceptions=False):
+    """Page texts of several PDFs (paths or bytes), extracting each page at most once.
+
+    Pages not already cached are parsed together by the PDF engine, so the pages
+    of all documents share the worker pool. With return_exceptions=True a document
+    that can't be read yields its exception instead of a list of page texts.
+    """
+    results = []
+    pending = []
+    for source in sources:
+        try:
+            data = read_pdf(source)
+            digest = pdf_digest(data)
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            results.append(e)
+            continue
+
+        count = page_cache.get(_count_key(digest))
+        if count is None:
+            # Never seen this document; every page needs parsing
+            pending.append((len(results), digest, data, None))
+            results.append(None)
+            continue
+        texts = [page_cache.get(_page_key(digest, i)) for i in range(count)]
+        missing = [i for i, text in enumerate(texts) if text is None]
+        metrics.PDF_PAGES.inc(count - len(missing), source="cached")
+        if missing:
+            pending.append((len(results), digest, data, missing))
+        results.append(texts)
+
+    if pending:
+        started = time.perf_counter()
+        extracted = extract_pages([(data, missing) for _, _, data, missing in pending], return_exceptions=return_exceptions)
+        # Attribute the parsing time evenly to the pages, for the cache's saved_seconds
+        parsed_pages = sum(len(texts) for texts in extracted if not isinstance(texts, Exception))
+        metrics.PDF_PAGES.inc(parsed_pages, source="parsed")
+        seconds = (time.perf_counter() - started) / max(parsed_pages, 1)
+        for (position, digest, _, missing), texts in zip(pending, extracted):
+            if isinstance(texts, Exception):
+                results[position] = texts
+                continue
+            if missing is None:
+                page_cache.set(_count_key(digest), len(texts))
+                missing = range(len(texts))
+                results[position] = [None] * len(texts)
+            for i, text in zip(missing, texts):
+                page_cache.set(_page_key(digest, i), text, seconds=seconds)
+                results[position][i] = text
+    return results
+
+
+def extract_page_texts(source):
+    """Text of every page of a PDF (path or bytes), extracting each page at most once."""
+    return extract_documents_page_texts([source])[0]
+
+
+def iter_page_texts(source, batch_pages=32, first_batch_pages=None):
+    """Yield (page index, text) in page order, parsing `batch_pages` uncached pages at a time.
+
+    Lets callers process long documents page by page without waiting for, or
+    holding, the text of the whole document. With first_batch_pages, batches
+    start at that size and double up to batch_pages, so a caller that stops
+    after the first pages hasn't paid for many it never reads.
+    """
+    data = read_pdf(source)
+    digest = pdf_digest(data)
+    count = page_cache.get(_count_key(digest))
+    if count is None:
+        count = page_count(data)
+        page_cache.set(_count_key(digest), count)
+
+    start = 0
+    size = min(first_batch_pages or batch_pages, batch_pages)
+    while start < count:
+        indices = range(start, min(start + size, count))
+        start += size
+        size = min(size * 2, batch_pages)
+        texts = {i: page_cache.get(_page_key(digest, i)) for i in indices}
+        missing = [i for i, text in texts.items() if text is None]
+        metrics.PDF_PAGES.inc(len(texts) - len(missing), source="cached")
+        if missing:
+            started = time.perf_counter()
+            extracted = extract_pages([(data, missing)])[0]
+            metrics.PDF_PAGES.inc(len(missing), source="parsed")
+            seconds = (time.perf_counter() - started) / len(missing)
+            for i, text in zip(missing, extracted):
+                page_cache.set(_page_key(digest, i), text, seconds=seconds)
+                texts[i] = text
+        for i in indices:
+            yield i, texts[i]
+
+
+def extract_text(source):
+    """All non-empty page texts of a PDF joined by newlines."""
+    return "\n".join(text for text in extract_page_texts(source) if text)
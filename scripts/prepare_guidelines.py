@@ -1,25 +1,33 @@
-import pdfplumber
 import json
+import hashlib
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 import argparse
 from openai import OpenAI
 import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.pdf_text import extract_text, iter_page_texts
+from scripts.pdf_engine import PDF_POOL_WORKERS, PDF_POOL_PAGES_PER_TASK
+from scripts.guideline_index import build_index, section_headings
 
-def pdf_to_jsonl(pdf_path: str, output_path: str = "guidelines.json"):
-    """Convert PDF to JSONL format for OpenAI"""
-    print("Reading PDF...")
-    with pdfplumber.open(pdf_path) as pdf:
-        text = "\n".join(
-            page.extract_text() for page in pdf.pages 
-            if page.extract_text()
-        )
-    
-    print("Splitting into chunks...")
-    text_splitter = RecursiveCharacterTextSplitter(
+# Pages parsed per batch when ingesting: a task for every PDF pool worker, rather
+# than iter_page_texts' default of 32 pages, which keeps only two of them busy
+INGEST_BATCH_PAGES = max(1, PDF_POOL_WORKERS) * PDF_POOL_PAGES_PER_TASK
+
+def make_splitter():
+    return RecursiveCharacterTextSplitter(
         chunk_size=200,
         chunk_overlap=20,
         separators=["\n\n", "\n", ".", " "]
     )
+
+def pdf_to_jsonl(pdf_path: str, output_path: str = "guidelines.json", index_path: str = "guidelines.idx", upload: bool = True):
+    """Convert PDF to JSONL format for OpenAI"""
+    print("Reading PDF...")
+    text = extract_text(pdf_path)
+    
+    print("Splitting into chunks...")
+    text_splitter = make_splitter()
     chunks = text_splitter.split_text(text)
     
     print(f"Writing {len(chunks)} chunks to JSON...")
@@ -36,6 +44,15 @@ def pdf_to_jsonl(pdf_path: str, output_path: str = "guidelines.json"):
         json.dump(data, f, indent=2)
     
     print(f"JSON file created at: {output_path}")
+
+    # Local retrieval index used by run_assistant to ground guideline citations
+    if index_path:
+        print("Building retrieval index...")
+        build_index(data, index_path)
+        print(f"Index created at: {index_path}")
+
+    if not upload:
+        return None
     
     # Upload to OpenAI
     print("Uploading to OpenAI...")
@@ -53,12 +70,150 @@ def pdf_to_jsonl(pdf_path: str, output_path: str = "guidelines.json"):
     print(json.dumps(response.model_dump(), indent=2))
     return response.id
 
+def upload_file(path):
+    api_key = os.getenv("OPENAI_API_KEY").strip()
+    client = OpenAI(api_key=api_key)
+    with open(path, "rb") as file:
+        response = client.files.create(
+            file=file,
+            purpose="assistants"
+        )
+    return response.id
+
+def read_jsonl(path):
+    with open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def ingest_guidelines(pdf_path: str, output_path: str = "guidelines.jsonl", state_path: str = None, index_path: str = "guidelines.idx", upload: bool = True):
+    """Incrementally convert the guideline PDF to JSONL, page by page.
+
+    Chunks are written as soon as each page is processed. Every page is keyed by
+    the hash of its own text (plus its occurrence number when the same text
+    repeats), and chunk IDs are derived from it, so they survive page
+    renumbering when Fannie Mae republishes the guide and editing one page
+    doesn't re-key the pages after it. On a rerun only pages whose hash changed
+    are re-chunked; the section of the chunks of unchanged pages, which depends
+    on the headings of earlier pages, is recomputed and the page counts as
+    changed only if it moved. The index is rebuilt and the changed chunks
+    uploaded only when something actually changed.
+    """
+    state_path = state_path or f"{output_path}.state.json"
+    previous_state = {"pages": [], "uploads": []}
+    if os.path.exists(state_path):
+        with open(state_path, "r") as f:
+            previous_state = json.load(f)
+
+    # Chunks of the previous run, by page key, so unchanged pages are copied as they are
+    previous_chunks = {}
+    if os.path.exists(output_path):
+        for record in read_jsonl(output_path):
+            previous_chunks.setdefault(record["metadata"]["page_key"], []).append(record)
+        previous_keys = {page["key"] for page in previous_state["pages"]}
+    else:
+        # Without the previous output there is nothing to copy from
+        previous_keys = set()
+
+    text_splitter = make_splitter()
+    pages = []
+    changed_pages = 0
+    section = None
+    seen = {}
+    temp_output = f"{output_path}.tmp"
+    delta_output = f"{output_path}.delta.jsonl"
+    print("Reading PDF page by page...")
+    with open(temp_output, "w") as out, open(delta_output, "w") as delta:
+        for page_index, text in iter_page_texts(pdf_path, batch_pages=INGEST_BATCH_PAGES):
+            page_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+            # The section a page starts in; headings on the page carry over to the next one
+            page_section = section
+            headings = section_headings(text)
+            if headings:
+                section = headings[-1]
+            # Identical pages (repeated headers, blank pages) still get distinct IDs
+            seen[page_hash] = seen.get(page_hash, 0) + 1
+            page_key = page_hash if seen[page_hash] == 1 else f"{page_hash}~{seen[page_hash]}"
+
+            if page_key in previous_keys:
+                # Pages without chunks (blank ones) have no records in the previous output
+                records = previous_chunks.get(page_key, [])
+                resectioned = False
+                chunk_section = page_section
+                for record in records:
+                    chunk_headings = section_headings(record["text"])
+                    if chunk_headings:
+                        chunk_section = chunk_headings[0]
+                    resectioned = resectioned or record["metadata"]["section"] != chunk_section
+                    record["metadata"].update(page=page_index, section=chunk_section)
+                if resectioned:
+                    # A heading on an earlier page changed the section this page falls under
+                    changed_pages += 1
+                    for record in records:
+                        delta.write(json.dumps(record) + "\n")
+            else:
+                changed_pages += 1
+                records = []
+                chunk_section = page_section
+                for n, chunk in enumerate(text_splitter.split_text(text)):
+                    chunk_headings = section_headings(chunk)
+                    if chunk_headings:
+                        chunk_section = chunk_headings[0]
+                    records.append({
+                        "id": f"{page_key}/{n}",
+                        "text": chunk,
+                        "metadata": {
+                            "page": page_index,
+                            "page_key": page_key,
+                            "section": chunk_section
+                        }
+                    })
+                for record in records:
+                    delta.write(json.dumps(record) + "\n")
+
+            for record in records:
+                out.write(json.dumps(record) + "\n")
+            pages.append({"page": page_index, "key": page_key, "chunks": [record["id"] for record in records]})
+            if (page_index + 1) % 100 == 0:
+                print(f"  {page_index + 1} pages processed, {changed_pages} changed")
+
+    os.replace(temp_output, output_path)
+    current_keys = {page["key"] for page in pages}
+    removed_pages = len(previous_keys - current_keys)
+    print(f"{len(pages)} pages, {changed_pages} new or changed, {removed_pages} removed. JSONL written to: {output_path}")
+
+    changed = changed_pages > 0 or removed_pages > 0
+    if index_path and (changed or not os.path.exists(index_path)):
+        print("Rebuilding retrieval index...")
+        build_index(read_jsonl(output_path), index_path)
+        print(f"Index created at: {index_path}")
+
+    uploads = previous_state.get("uploads", [])
+    if upload and changed_pages:
+        print("Uploading changed chunks to OpenAI...")
+        file_id = upload_file(delta_output)
+        uploads.append({"file_id": file_id, "pages": changed_pages})
+        print(f"File uploaded successfully! File ID: {file_id}")
+    os.remove(delta_output)
+
+    with open(state_path, "w") as f:
+        json.dump({"pdf": os.path.basename(pdf_path), "pages": pages, "uploads": uploads}, f)
+    return {"pages": len(pages), "changed": changed_pages, "removed": removed_pages}
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Convert PDF guidelines to JSON format")
     parser.add_argument("--pdf", required=True, help="Path to the PDF file")
     parser.add_argument("--output", default="guidelines.json", help="Output JSON file path")
+    parser.add_argument("--index", default="guidelines.idx", help="Output path of the local retrieval index (empty to skip)")
+    parser.add_argument("--no-upload", action="store_true", help="Don't upload the chunks to OpenAI")
+    parser.add_argument("--incremental", action="store_true", help="Stream the PDF page by page into JSONL and only reprocess pages that changed since the last run")
+    parser.add_argument("--state", help="State file of the incremental mode (default: <output>.state.json)")
     args = parser.parse_args()
     
-    file_id = pdf_to_jsonl(args.pdf, args.output)
+    if args.incremental:
+        output = args.output if args.output != "guidelines.json" else "guidelines.jsonl"
+        ingest_guidelines(args.pdf, output, args.state, args.index, upload=not args.no_upload)
+    else:
+        file_id = pdf_to_jsonl(args.pdf, args.output, args.index, upload=not args.no_upload)
 
 
@@ -0,0 +1,135 @@
+import json
+import os
+
+# Token budget for the user prompt. Structured fields always go in; guideline
+# excerpts and raw document text fill whatever is left, lowest value last.
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "3000"))
+
+# Keys of paystub_data that hold free text rather than extracted fields
+TEXT_KEYS = ("raw_text", "text")
+# Keys that describe how the data was extracted (per-field confidence included); of no use to the model
+METADATA_KEYS = ("backend", "pages_scanned", "variable_income", "confidence")
+
+try:
+    import tiktoken
+    _encoding = tiktoken.encoding_for_model("gpt-4")
+except Exception:
+    # tiktoken missing or its encoding can't be loaded (e.g. offline); estimate instead
+    _encoding = None
+
+
+def count_tokens(text):
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    # Roughly four characters per token for English text
+    return (len(text) + 3) // 4
+
+
+def truncate_tokens(text, max_tokens):
+    if max_tokens <= 0:
+        return ""
+    if _encoding is not None:
+        tokens = _encoding.encode(text)
+        return text if len(tokens) <= max_tokens else _encoding.decode(tokens[:max_tokens])
+    return text[:max_tokens * 4]
+
+
+def compact_json(data):
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+
+def condense_text(text):
+    """Drop layout noise before spending tokens on raw text.
+
+    Whitespace runs are collapsed and lines with no letters or digits (rules
+    such as "-----") or repeated verbatim are removed.
+    """
+    lines = []
+    seen = set()
+    for line in text.splitlines():
+        line = " ".join(line.split())
+        if not any(c.isalnum() for c in line) or line in seen:
+            continue
+        seen.add(line)
+        lines.append(line)
+    return "\n".join(lines)
+
+
+HEADER = """You are an expert mortgage underwriting assistant following Fannie Mae guidelines.
+
+Use the following extracted paystub data and borrower application data to determine the qualifying monthly income."""
+
+FOOTER = """Respond with:
+- Monthly qualifying income
+- Income type (Salaried)
+- Action items (e.g., missing docs, clarification needs)
+- Guideline references (e.g., B3-3.1-05)"""
+
+
+def format_guideline(guideline):
+    section = guideline.get("section") or "Selling Guide"
+    return f"[{section}] {' '.join(guideline['text'].split())}"
+
+
+def build_prompt(paystub_data, borrower_data, guidelines=None, budget=None):
+    """Build the user prompt within a token budget.
+
+    Returns (prompt, report) where report has the budget, the total, the tokens
+    used per section and what had to be dropped or cut to fit.
+    """
+    budget = PROMPT_TOKEN_BUDGET if budget is None else budget
+    paystub_data = paystub_data or {}
+    fields = {key: value for key, value in paystub_data.items() if key not in TEXT_KEYS + METADATA_KEYS}
+    raw_text = "\n".join(str(paystub_data[key]) for key in TEXT_KEYS if paystub_data.get(key))
+
+    sections = {}
+    report = {"budget": budget, "sections": {}, "dropped_guidelines": 0, "raw_text_truncated": False}
+
+    def add(name, text):
+        sections[name] = text
+        report["sections"][name] = count_tokens(text)
+
+    add("instructions", f"{HEADER}\n\n{FOOTER}")
+    if fields:
+        add("paystub_fields", f"Paystub Data:\n{compact_json(fields)}")
+    add("borrower", f"Borrower Info:\n{compact_json(borrower_data)}")
+
+    # Guidelines arrive best first; keep as many as fit
+    remaining = budget - sum(report["sections"].values())
+    kept = []
+    for guideline in guidelines or []:
+        line = format_guideline(guideline)
+        tokens = count_tokens(line) + 1
+        if tokens > remaining:
+            report["dropped_guidelines"] += 1
+            continue
+        kept.append(line)
+        remaining -= tokens
+    if kept:
+        add("guidelines", "Relevant Fannie Mae Guidelines (cite these by section where they apply):\n" + "\n".join(kept))
+        remaining = budget - sum(report["sections"].values())
+
+    # Raw text is the lowest-value section: condensed first, then cut to what is left
+    if raw_text:
+        label = "Paystub Text (excerpt):\n" if fields else "Paystub Text:\n"
+        text = condense_text(raw_text)
+        available = remaining - count_tokens(label)
+        if count_tokens(text) > available:
+            text = truncate_tokens(text, available)
+            report["raw_text_truncated"] = True
+        if text:
+            add("raw_text", label + text)
+
+    order = ("paystub_fields", "borrower", "guidelines", "raw_text")
+    body = "\n\n".join(sections[name] for name in order if name in sections)
+    prompt = f"{HEADER}\n\n{body}\n\n{FOOTER}"
+    report["total"] = count_tokens(prompt)
+    report["over_budget"] = report["total"] > budget
+    return prompt, report
+
+
+def describe_report(report):
+    sections = ", ".join(f"{name} {tokens}" for name, tokens in report["sections"].items())
+    return f"Prompt tokens: {report['total']}/{report['budget']} ({sections})"
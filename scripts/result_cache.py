@@ -0,0 +1,207 @@
+import copy
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def cache_key(*parts):
+    """Stable SHA-256 over JSON-serializable parts, independent of dict key order."""
+    canonical = json.dumps(parts, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """Two-tier cache: an in-memory LRU in front of an optional SQLite file.
+
+    Entries expire after `ttl` seconds (None keeps them forever). The memory tier
+    holds at most `max_memory_entries`; the disk tier evicts least recently used
+    entries once the stored values exceed `max_disk_bytes`. The disk tier's size
+    is kept as a running total, and memory hits mark their rows as used in
+    batches of TOUCH_BATCH, so neither a set nor a hit scans the table.
+
+    Each entry can carry the seconds and tokens it cost to compute, so stats()
+    reports how much latency and spend the hits saved.
+    """
+
+    # Memory hits whose accessed_at is written to disk at once
+    TOUCH_BATCH = 64
+    # Seconds between sweeps for expired rows on the disk tier
+    EXPIRY_SWEEP_SECONDS = 60
+
+    def __init__(self, path=None, ttl=None, max_memory_entries=256, max_disk_bytes=256 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+            "saved_seconds": 0.0,
+            "saved_tokens": 0
+        }
+        self._db = None
+        self._touched = {}
+        self._next_sweep = 0.0
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            # Losing the last few writes on a power cut is fine for a cache; an fsync per set isn't
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    seconds REAL,
+                    tokens INTEGER,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)")
+            self._db.commit()
+            self._disk_entries, self._disk_bytes = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache"
+            ).fetchone()
+
+    def _expired(self, created_at, now):
+        return self.ttl is not None and now - created_at > self.ttl
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            evicted, _ = self._memory.popitem(last=False)
+            self._touched.pop(evicted, None)
+            self._counters["memory_evictions"] += 1
+
+    def _hit(self, tier, entry):
+        self._counters[tier] += 1
+        self._counters["saved_seconds"] += entry["seconds"] or 0.0
+        self._counters["saved_tokens"] += entry["tokens"] or 0
+        # Hand out a copy so callers can't modify what is cached
+        return copy.deepcopy(entry["value"])
+
+    def _flush_touched(self):
+        """Write the accessed_at of memory hits to disk, so the disk LRU sees them; caller commits."""
+        if self._touched:
+            self._db.executemany(
+                "UPDATE cache SET accessed_at = ? WHERE key = ?",
+                [(accessed_at, key) for key, accessed_at in self._touched.items()]
+            )
+            self._touched.clear()
+
+    def _delete(self, key):
+        row = self._db.execute("SELECT size FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return False
+        self._db.execute("DELETE FROM cache WHERE key = ?", (key,))
+        self._disk_entries -= 1
+        self._disk_bytes -= row[0]
+        return True
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry["created_at"], now):
+                    self._memory.move_to_end(key)
+                    if self._db is not None:
+                        self._touched[key] = now
+                        if len(self._touched) >= self.TOUCH_BATCH:
+                            self._flush_touched()
+                            self._db.commit()
+                    return self._hit("memory_hits", entry)
+                del self._memory[key]
+                self._touched.pop(key, None)
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, seconds, tokens, created_at FROM cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    if not self._expired(row[3], now):
+                        self._db.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+                        self._db.commit()
+                        entry = {"value": json.loads(row[0]), "seconds": row[1], "tokens": row[2], "created_at": row[3]}
+                        self._remember(key, entry)
+                        return self._hit("disk_hits", entry)
+                    if self._delete(key):
+                        self._counters["disk_evictions"] += 1
+                    self._db.commit()
+
+            self._counters["misses"] += 1
+            return None
+
+    def set(self, key, value, seconds=None, tokens=None):
+        now = time.time()
+        entry = {"value": copy.deepcopy(value), "seconds": seconds, "tokens": tokens, "created_at": now}
+        with self._lock:
+            self._remember(key, entry)
+            self._touched.pop(key, None)
+            self._counters["stores"] += 1
+            if self._db is not None:
+                encoded = json.dumps(value)
+                self._delete(key)
+                self._db.execute(
+                    "INSERT INTO cache (key, value, size, seconds, tokens, created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, encoded, len(encoded), seconds, tokens, now, now)
+                )
+                self._disk_entries += 1
+                self._disk_bytes += len(encoded)
+                self._evict_disk(now)
+                self._db.commit()
+
+    def _evict_disk(self, now):
+        if self.ttl is not None and now >= self._next_sweep:
+            self._next_sweep = now + self.EXPIRY_SWEEP_SECONDS
+            for (key,) in self._db.execute("SELECT key FROM cache WHERE created_at < ?", (now - self.ttl,)).fetchall():
+                if self._delete(key):
+                    self._counters["disk_evictions"] += 1
+        if self._disk_bytes <= self.max_disk_bytes:
+            return
+        # Other processes sharing the file add and drop rows too; recount before evicting
+        self._disk_entries, self._disk_bytes = self._db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache"
+        ).fetchone()
+        # The LRU order has to include the memory hits not written yet
+        self._flush_touched()
+        # Drop least recently used rows until we are back under the size limit
+        for key, size in self._db.execute("SELECT key, size FROM cache ORDER BY accessed_at").fetchall():
+            if self._disk_bytes <= self.max_disk_bytes:
+                break
+            if self._delete(key):
+                self._counters["disk_evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._touched.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM cache")
+                self._db.commit()
+                self._disk_entries, self._disk_bytes = 0, 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+            stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+            stats["memory_entries"] = len(self._memory)
+            if self._db is not None:
+                stats["disk_entries"] = self._disk_entries
+                stats["disk_bytes"] = self._disk_bytes
+            return stats
@@ -0,0 +1,151 @@
+import math
+import os
+import re
+from datetime import date
+
+# Deterministic fast path for plain salaried income. Returns the same shape as the
+# underwrite_income tool, or None when the case needs the model's judgement.
+RULES_ENGINE_ENABLED = os.getenv("RULES_ENGINE_ENABLED", "1") not in ("0", "false", "False", "")
+# Extracted fields below this confidence are treated as missing
+RULES_MIN_CONFIDENCE = float(os.getenv("RULES_MIN_CONFIDENCE", "0.7"))
+# Relative differences tolerated before raising an action item
+YTD_TOLERANCE = float(os.getenv("RULES_YTD_TOLERANCE", "0.05"))
+STATED_INCOME_TOLERANCE = float(os.getenv("RULES_STATED_INCOME_TOLERANCE", "0.10"))
+# Fannie Mae wants the paystub dated no earlier than 30 days before the application
+MAX_PAYSTUB_AGE_DAYS = 30
+
+PERIODS_PER_YEAR = {"Weekly": 52, "Biweekly": 26, "Semimonthly": 24, "Monthly": 12}
+REQUIRED_FIELDS = ("gross_pay_per_period", "pay_frequency", "ytd_income", "pay_period_end")
+
+# Earnings that make income variable and need judgement about history and stability
+VARIABLE_INCOME = re.compile(r"\b(?:overtime|bonus|commissions?|tips)\b", re.IGNORECASE)
+
+CITATIONS = [
+    "B3-3.1-01, General Income Information",
+    "B3-3.1-02, Standards for Employment Documentation",
+    "B3-3.1-03, Base Pay (Salary or Hourly), Bonus, and Overtime Income"
+]
+
+STANDARD_ACTION_ITEMS = [
+    "Obtain W-2 forms for the most recent calendar year to confirm the base pay history.",
+    "Complete a verbal verification of employment within 10 business days prior to the note date."
+]
+
+
+def _periods_elapsed(frequency, period_end):
+    """Pay periods from January 1 through the period ending on period_end."""
+    day_of_year = period_end.timetuple().tm_yday
+    if frequency == "Weekly":
+        return math.ceil(day_of_year / 7)
+    if frequency == "Biweekly":
+        return math.ceil(day_of_year / 14)
+    if frequency == "Semimonthly":
+        return (period_end.month - 1) * 2 + (1 if period_end.day <= 15 else 2)
+    return period_end.month
+
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+def _differs(actual, expected, tolerance):
+    return expected > 0 and abs(actual - expected) / expected > tolerance
+
+
+def evaluate_salaried(paystub_data, borrower_data):
+    """Qualifying income for a straightforward salaried paystub, or None to escalate to the LLM."""
+    if not RULES_ENGINE_ENABLED or not isinstance(paystub_data, dict):
+        return None
+    borrower_data = borrower_data or {}
+
+    # Salaried only when the borrower data says so or, when it doesn't say, the
+    # stub has no hours x rate earnings line; anything else is for the model
+    income_type = borrower_data.get("income_type") or borrower_data.get("employment_type")
+    if income_type and str(income_type).lower() != "salaried":
+        return None
+    if paystub_data.get("hours") is not None or paystub_data.get("rate") is not None:
+        return None
+
+    confidence = paystub_data.get("confidence") or {}
+    for field in REQUIRED_FIELDS:
+        if paystub_data.get(field) is None or confidence.get(field, 0) < RULES_MIN_CONFIDENCE:
+            return None
+
+    # Set from the full text during extraction; raw_text is only an excerpt
+    variable_income = paystub_data.get("variable_income")
+    if variable_income is None:
+        variable_income = bool(VARIABLE_INCOME.search(paystub_data.get("raw_text") or ""))
+    if variable_income:
+        return None
+
+    frequency = paystub_data["pay_frequency"]
+    gross = paystub_data["gross_pay_per_period"]
+    ytd = paystub_data["ytd_income"]
+    period_end = _parse_date(paystub_data["pay_period_end"])
+    period_start = _parse_date(paystub_data.get("pay_period_start") or paystub_data["pay_period_end"])
+    # Inconsistent inputs are for the model (and the underwriter), not for arithmetic
+    if frequency not in PERIODS_PER_YEAR or period_end is None or period_start is None:
+        return None
+    if gross <= 0 or ytd < gross or period_end < period_start:
+        return None
+
+    periods_per_year = PERIODS_PER_YEAR[frequency]
+    base_monthly = gross * periods_per_year / 12
+    qualifying_monthly = base_monthly
+    action_items = []
+
+    periods = _periods_elapsed(frequency, period_end)
+    expected_ytd = gross * periods
+    if _differs(ytd, expected_ytd, YTD_TOLERANCE):
+        ytd_monthly = ytd / periods * periods_per_year / 12
+        if ytd < expected_ytd:
+            # Use the lower, year-to-date supported figure until the difference is explained
+            qualifying_monthly = ytd_monthly
+            action_items.append(
+                f"YTD earnings (${ytd:,.2f}) are below {periods} {frequency.lower()} periods at the current "
+                f"gross pay (${expected_ytd:,.2f}); qualifying income uses the YTD average of ${ytd_monthly:,.2f}/month. "
+                "Confirm start date, unpaid leave or a recent pay change."
+            )
+        else:
+            action_items.append(
+                f"YTD earnings (${ytd:,.2f}) exceed {periods} {frequency.lower()} periods at the current "
+                f"gross pay (${expected_ytd:,.2f}). Confirm whether the difference is bonus, overtime or a pay "
+                "change before using any of it; qualifying income uses base pay only."
+            )
+
+    stated_income = borrower_data.get("stated_income")
+    documented_annual = qualifying_monthly * 12
+    if isinstance(stated_income, (int, float)) and stated_income > 0 and _differs(stated_income, documented_annual, STATED_INCOME_TOLERANCE):
+        action_items.append(
+            f"Stated annual income (${stated_income:,.2f}) differs from documented income "
+            f"(${documented_annual:,.2f}/year). Reconcile with the borrower."
+        )
+
+    employer = borrower_data.get("employer")
+    employer_on_stub = paystub_data.get("employer_name")
+    if employer and employer_on_stub:
+        a, b = str(employer).lower().strip(), str(employer_on_stub).lower().strip()
+        if a not in b and b not in a:
+            action_items.append(
+                f"Employer on the paystub ('{employer_on_stub}') differs from the application ('{employer}'). "
+                "Verify the borrower's current employer."
+            )
+
+    application_date = _parse_date(borrower_data.get("application_date") or borrower_data.get("submitted_at") or "")
+    pay_date = _parse_date(paystub_data.get("pay_date") or paystub_data["pay_period_end"])
+    if application_date and pay_date and (application_date - pay_date).days > MAX_PAYSTUB_AGE_DAYS:
+        action_items.append(
+            f"Paystub dated {pay_date} is more than {MAX_PAYSTUB_AGE_DAYS} days before the application "
+            f"({application_date}). Obtain a more recent paystub."
+        )
+
+    action_items.extend(STANDARD_ACTION_ITEMS)
+    return {
+        "qualifying_income_monthly": round(qualifying_monthly, 2),
+        "income_type": "Salaried",
+        "action_items": action_items,
+        "guideline_citations": list(CITATIONS)
+    }
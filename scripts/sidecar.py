@@ -0,0 +1,76 @@
+import hashlib
+import os
+import sys
+from datetime import datetime
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.parse_paystub import extract_document_pages
+
+# Written next to metadata.json by the intake app once the uploaded documents are
+# parsed, so the reviewer and the API can evaluate an application without
+# downloading or parsing its PDFs.
+EXTRACTED_FILE = "extracted.json"
+# Bump when the layout or the extraction changes; older sidecars are then ignored
+SIDECAR_VERSION = 3
+
+
+def build_sidecar(documents):
+    """Extraction results for [(file name, PDF bytes), ...], in upload order.
+
+    Each document records its size, SHA-256 and MD5 so readers can tell whether
+    the sidecar still describes the files next to it: local readers hash the
+    files, Supabase readers compare the MD5 with the object's ETag.
+    """
+    extracted = []
+    for name, data in documents:
+        pages, paystub = extract_document_pages(data)
+        extracted.append({
+            "name": name,
+            "size": len(data),
+            "sha256": hashlib.sha256(data).hexdigest(),
+            "md5": hashlib.md5(data).hexdigest(),
+            "pages": pages,
+            "paystub": paystub
+        })
+    return {
+        "version": SIDECAR_VERSION,
+        "extracted_at": datetime.now().isoformat(),
+        "documents": extracted
+    }
+
+
+def _etag_md5(etag):
+    # Storage ETags are the quoted MD5 of the object, except for multipart uploads ("<md5>-<parts>")
+    etag = (etag or "").strip().strip('"').lower()
+    if etag.startswith("w/"):
+        etag = etag[2:].strip('"')
+    return etag if len(etag) == 32 and all(c in "0123456789abcdef" for c in etag) else None
+
+
+def _matches(entry, document):
+    if document.get("size") is not None and entry["size"] != document["size"]:
+        return False
+    # Equal sizes prove little (the sample paystubs are all 2161 bytes); require a content hash
+    if document.get("sha256") is not None:
+        return entry["sha256"] == document["sha256"]
+    md5 = _etag_md5(document.get("etag"))
+    return md5 is not None and entry.get("md5") == md5
+
+
+def sidecar_documents(sidecar, documents):
+    """The sidecar's entries for documents, or None if it doesn't cover them.
+
+    documents are [{"name", "size", "sha256"}, ...] for local files or
+    [{"name", "size", "etag"}, ...] for stored objects. A document matches an
+    entry with the same name whose hash agrees; a document whose content can't
+    be verified (no SHA-256, no MD5 ETag) doesn't match.
+    """
+    if not isinstance(sidecar, dict) or sidecar.get("version") != SIDECAR_VERSION:
+        return None
+    by_name = {entry["name"]: entry for entry in sidecar.get("documents", [])}
+    entries = []
+    for document in documents:
+        entry = by_name.get(document["name"])
+        if entry is None or not _matches(entry, document):
+            return None
+        entries.append(entry)
+    return entries
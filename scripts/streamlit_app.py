@@ -3,13 +3,20 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import streamlit as st
-import json
-from scripts.evaluate_income import run_assistant
-from streamlit_renderer import render_evaluation
+import asyncio
+import queue
+import re
+import threading
+from scripts.evaluate_income import stream_assistant, MODEL, PROMPT_VERSION
+from scripts.document_fetch import fetch_application_texts
+from scripts.document_summary import summarize_documents
+from scripts.application_index import ApplicationIndex
+from scripts.analysis_store import AnalysisStore, inputs_key
+from datetime import datetime
+from streamlit_renderer import render_evaluation, render_extracted_fields
 from openai import OpenAI
 from dotenv import load_dotenv
 from supabase import create_client
-import io
 
 # Load environment variables from .env file
 load_dotenv()
@@ -21,6 +28,72 @@ supabase_bucket = os.environ.get("SUPABASE_BUCKET")
 
 supabase = create_client(supabase_url, supabase_key)
 
+# Applications shown per "show applications" page
+APPLICATIONS_PAGE_SIZE = 50
+# Chat messages and saved analyses shown per page of the history tab
+HISTORY_PAGE_SIZE = 20
+
+
+@st.cache_resource
+def get_application_index():
+    """One index per server process, shared by every session and rerun."""
+    return ApplicationIndex(
+        supabase.storage.from_(supabase_bucket),
+        path=os.getenv("APPLICATION_INDEX_PATH", ".cache/applications.sqlite3") or None,
+        ttl=float(os.getenv("APPLICATION_INDEX_TTL", "300"))
+    )
+
+
+@st.cache_resource
+def get_analysis_store():
+    """Analyses saved across sessions, shared by every session of this server."""
+    return AnalysisStore(os.getenv("ANALYSIS_STORE_PATH", ".cache/analyses.sqlite3") or None)
+
+
+@st.cache_resource
+def get_event_loop():
+    """An event loop running in a background thread, shared by every session.
+
+    The async OpenAI client keeps its connections on the loop it first ran on,
+    so evaluations are all scheduled here rather than on a new loop per run.
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="assistant-loop", daemon=True).start()
+    return loop
+
+
+def stream_events(paystub_data, borrower_data):
+    """stream_assistant's (event, data) pairs, consumed from this (script) thread as they arrive."""
+    events = queue.Queue()
+    done = object()
+
+    async def pump():
+        try:
+            async for event in stream_assistant(paystub_data, borrower_data):
+                events.put(event)
+        finally:
+            events.put(done)
+
+    future = asyncio.run_coroutine_threadsafe(pump(), get_event_loop())
+    try:
+        while True:
+            event = events.get()
+            if event is done:
+                break
+            yield event
+        future.result()
+    finally:
+        # The user left or reran the script; stop the model call
+        future.cancel()
+
+
+def history_page(label, total, key):
+    """Page number picked for a paginated list of total items, 1 being the newest."""
+    pages = max((total + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE, 1)
+    if pages == 1:
+        return 1
+    return st.number_input(f"{label} page (of {pages})", min_value=1, max_value=pages, value=1, key=key)
+
 # Set page config early
 st.set_page_config(page_title="Underwriter Assistant", layout="centered")
 
@@ -93,7 +166,10 @@ with analysis_tab:
     if st.session_state.current_analysis:
         # Display the current analysis here
         st.subheader(f"Analysis for: {st.session_state.current_analysis['folder_name']}")
-        # The render_evaluation function will display the analysis content here
+        saved = get_analysis_store().get(st.session_state.current_analysis.get("analysis_id"))
+        if saved:
+            st.caption(f"Analyzed {datetime.fromtimestamp(saved['created_at']):%Y-%m-%d %H:%M}")
+            render_evaluation(saved["result"], saved["borrower_data"], saved["documents"])
     elif st.session_state.applications_list:
         # Display the applications list
         st.subheader("Available Applications")
@@ -117,19 +193,31 @@ if user_input:
     # Process user input
     if any(word in user_input.lower() for word in ["show", "list", "available", "applications", "files"]):
         try:
-            # List all folders in the Supabase bucket
+            # "show applications page 2", "show applications starting with na"
+            page_match = re.search(r"\bpage\s+(\d+)", user_input.lower())
+            prefix_match = re.search(r"starting with\s+(\S+)", user_input.lower())
+            page = max(int(page_match.group(1)), 1) if page_match else 1
+            prefix = prefix_match.group(1) if prefix_match else ""
+
             with st.spinner("Fetching applications..."):
-                response = supabase.storage.from_(supabase_bucket).list()
-                
-                if response:
+                index = get_application_index()
+                if "refresh" in user_input.lower():
+                    index.refresh(force=True)
+                total = index.count(prefix)
+                names = index.page((page - 1) * APPLICATIONS_PAGE_SIZE, APPLICATIONS_PAGE_SIZE, prefix)
+
+                if names:
                     items_list = []
-                    for item in response:
-                        items_list.append(f"- {item['name']}")
+                    for name in names:
+                        items_list.append(f"- {name}")
                     
                     # Create formatted response
                     formatted_list = "\n".join(items_list)
-                    response_text = f"📋 Here are the list of applications to review for today:\n\n{formatted_list}"
+                    pages = (total + APPLICATIONS_PAGE_SIZE - 1) // APPLICATIONS_PAGE_SIZE
+                    response_text = f"📋 Here are the list of applications to review for today (page {page} of {pages}, {total} total):\n\n{formatted_list}"
                     response_text += "\n\nTo analyze, type 'analyze' followed by the name (e.g., 'analyze Naga')"
+                    if page < pages:
+                        response_text += f"\n\nType 'show applications page {page + 1}' for more"
                     
                     # Clear any current analysis and set applications list
                     st.session_state.current_analysis = None
@@ -151,113 +239,129 @@ if user_input:
     elif user_input.lower().startswith("analyze"):
         # Extract name from command without assuming folder structure
         name_to_analyze = user_input.lower().replace("analyze", "").strip()
+        # "analyze Naga again" re-runs even if a saved analysis still applies
+        rerun_analysis = name_to_analyze.endswith(" again")
+        if rerun_analysis:
+            name_to_analyze = name_to_analyze[:-len(" again")].strip()
         
         # Clear applications list when analyzing
         st.session_state.applications_list = None
         
         with st.spinner(f"Analyzing {name_to_analyze}..."):
             try:
-                # First try a direct match
-                direct_match = False
-                
-                # List all items and look for matches
-                all_items = supabase.storage.from_(supabase_bucket).list()
-                
-                # Check for a matching metadata file
-                for item in all_items:
-                    if item['name'].endswith('metadata.json') and name_to_analyze in item['name']:
-                        metadata_path = item['name']
-                        direct_match = True
-                        break
-                
-                if not direct_match:
-                    # Try with path construction
-                    metadata_path = f"{name_to_analyze}/metadata.json"
-                
-                # Get metadata.json from Supabase
-                metadata_response = supabase.storage.from_(supabase_bucket).download(metadata_path)
-                borrower_data = json.loads(metadata_response.decode('utf-8'))
-
-                # Get list of related files - try both approaches
-                try:
-                    # Try to list contents as if name_to_analyze is a folder
-                    file_list = supabase.storage.from_(supabase_bucket).list(name_to_analyze)
-                except Exception:
-                    # If that fails, search for matching filenames
-                    file_list = []
-                    for item in all_items:
-                        if name_to_analyze in item['name'] and item['name'].endswith('.pdf'):
-                            file_list.append(item)
-                
-                pdf_files = [item['name'] for item in file_list if item['name'].endswith('.pdf')]
+                # Look the folder up in the application index instead of listing the bucket
+                application = get_application_index().get(name_to_analyze)
+                if application is None:
+                    raise ValueError(f"No application named '{name_to_analyze}' with a metadata.json")
+                name_to_analyze = application["name"]
+                borrower_data = application["borrower_data"]
+                documents = application["documents"]
                 
-                paystub_text = ""
-                document_contents = []  # Store document contents for rendering
-                
-                for pdf_file in pdf_files:
-                    try:
-                        # Download the PDF file - adjust path as needed
-                        if '/' in pdf_file:
-                            # If pdf_file already has path
-                            file_path = pdf_file
-                        else:
-                            # Construct path
-                            file_path = f"{name_to_analyze}/{pdf_file}"
-                        
-                        pdf_content = supabase.storage.from_(supabase_bucket).download(file_path)
-                        
-                        # Read the PDF content
-                        from PyPDF2 import PdfReader
-                        reader = PdfReader(io.BytesIO(pdf_content))
-                        
-                        # Extract text for analysis
-                        doc_text = "\\n".join(page.extract_text() or "" for page in reader.pages)
-                        paystub_text += doc_text
-                        
-                        # Store document content for rendering
+                store = get_analysis_store()
+                key = inputs_key(documents, borrower_data, MODEL, PROMPT_VERSION)
+                saved = None if rerun_analysis or key is None else store.find(name_to_analyze, key)
+                if saved:
+                    # Same documents and metadata as last time: nothing to download, parse or send to the model
+                    st.session_state.current_analysis = {"folder_name": name_to_analyze, "analysis_id": saved["id"]}
+                    response = (f"✅ Loaded the analysis of {name_to_analyze} from "
+                                f"{datetime.fromtimestamp(saved['created_at']):%Y-%m-%d %H:%M}; its documents haven't changed. "
+                                f"Type 'analyze {name_to_analyze} again' to run it anew.")
+                else:
+                    document_contents = []  # Store document contents for rendering
+
+                    # Page texts from the intake sidecar, or else downloaded and parsed concurrently
+                    page_texts = fetch_application_texts(supabase.storage.from_(supabase_bucket), application)
+                    named_pages = [(os.path.basename(document["path"]), pages) for document, pages in zip(documents, page_texts)]
+                    for pdf_file, pages in named_pages:
+                        if isinstance(pages, Exception):
+                            continue
                         document_contents.append({
                             "name": pdf_file,
-                            "content": doc_text
+                            "content": "\n".join(text for text in pages if text)
                         })
-                    except Exception as e:
-                        paystub_text += f"\\n[Error reading {pdf_file}: {e}]"
 
-                paystub_data = {"text": paystub_text}
+                    # Fields per document with repeated pages dropped, rather than every page of every upload
+                    paystub_data = summarize_documents(named_pages)
 
-                try:
-                    with st.spinner("Running AI analysis..."):
-                        result = run_assistant(paystub_data, borrower_data)
-                    
-                    # Store the current analysis for potential email
-                    st.session_state.current_analysis = {
-                        "folder_name": name_to_analyze,
-                        "result": result
-                    }
-                    
-                    # Switch to the analysis tab and render the evaluation
-                    with analysis_tab:
-                        render_evaluation(result, borrower_data, document_contents)
-                    
-                    # Still provide text response for chat history
-                    response = f"✅ Analysis complete for {name_to_analyze}! View results in the Current Analysis tab."
-                    
-                except Exception as e:
-                    response = f"❌ Error analyzing {name_to_analyze}: {str(e)}"
+                    try:
+                        # The fields are shown straight away, the income as soon as the model has written it
+                        with analysis_tab:
+                            st.subheader(f"Analysis for: {name_to_analyze}")
+                            render_extracted_fields(paystub_data)
+                            income_slot = st.empty()
+                        income_slot.info("Running AI analysis...")
+                        result = None
+                        for event, data in stream_events(paystub_data, borrower_data):
+                            if event == "llm_started":
+                                income_slot.info(f"Waiting for {data['model']}...")
+                            elif event == "income":
+                                income_slot.metric("Monthly Income (preliminary)", f"${data['qualifying_income_monthly']:,.2f}")
+                            elif event == "result":
+                                result = data
+
+                        # Failed evaluations aren't saved, so the next attempt runs again; nor are ones without an inputs key
+                        analysis_id = None
+                        if result.get("qualifying_income_monthly") is not None and key is not None:
+                            analysis_id = store.save(name_to_analyze, key, result, borrower_data, document_contents)
+
+                        # Store the current analysis for potential email
+                        st.session_state.current_analysis = {
+                            "folder_name": name_to_analyze,
+                            "analysis_id": analysis_id,
+                            "result": result
+                        }
+
+                        if analysis_id is None:
+                            income_slot.empty()
+                            with analysis_tab:
+                                render_evaluation(result, borrower_data, document_contents)
+
+                        # Still provide text response for chat history
+                        response = f"✅ Analysis complete for {name_to_analyze}! View results in the Current Analysis tab."
+
+                    except Exception as e:
+                        response = f"❌ Error analyzing {name_to_analyze}: {str(e)}"
             except Exception as e:
                 response = f"❌ Error retrieving data for {name_to_analyze}: {str(e)}"
     
     else:
         response = """👋 Hello! Here are the commands you can use:
-- 'show applications' to see available files
-- 'analyze Application' to analyze a specific application
+- 'show applications' to see available files ('page 2', 'starting with na', 'refresh')
+- 'analyze Application' to analyze a specific application ('analyze Application again' to ignore a saved analysis)
 """
 
     st.session_state.messages.append({"role": "assistant", "content": response})
 
-# Display chat history in the second tab
+    # Render the new analysis from the store in the Current Analysis tab
+    if st.session_state.current_analysis and st.session_state.current_analysis.get("analysis_id") and user_input.lower().startswith("analyze"):
+        st.rerun()
+
+# Display chat history in the second tab, a page at a time so long sessions stay quick to rerun
 with chat_history_tab:
+    st.subheader("Saved Analyses")
+    store = get_analysis_store()
+    total = store.count()
+    if total:
+        page = history_page("Analyses", total, "analyses_page")
+        for analysis in store.history((page - 1) * HISTORY_PAGE_SIZE, HISTORY_PAGE_SIZE):
+            income = analysis["result"].get("qualifying_income_monthly")
+            cols = st.columns([4, 1])
+            cols[0].markdown(
+                f"**{analysis['folder']}** · {datetime.fromtimestamp(analysis['created_at']):%Y-%m-%d %H:%M} · "
+                + (f"${income:,.2f}/month" if income is not None else "no income")
+            )
+            if cols[1].button("Open", key=f"open_analysis_{analysis['id']}"):
+                st.session_state.current_analysis = {"folder_name": analysis["folder"], "analysis_id": analysis["id"]}
+                st.session_state.applications_list = None
+                st.rerun()
+    else:
+        st.info("No saved analyses yet.")
+
     st.subheader("Previous Conversations")
-    for msg in st.session_state.messages:
+    messages = st.session_state.messages
+    page = history_page("Conversation", len(messages), "messages_page")
+    # Page 1 holds the newest messages, shown oldest first like a chat
+    end = len(messages) - (page - 1) * HISTORY_PAGE_SIZE
+    for msg in messages[max(end - HISTORY_PAGE_SIZE, 0):end]:
         with st.chat_message(msg["role"]):
             st.markdown(msg["content"])
-
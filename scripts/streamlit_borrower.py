@@ -1,11 +1,14 @@
-import streamlit as st
+import sys
 import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import streamlit as st
 import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from PyPDF2 import PdfReader
 import dotenv
 from supabase import create_client
-import io
+from scripts.sidecar import EXTRACTED_FILE, build_sidecar
 
 # Load environment variables
 dotenv.load_dotenv()
@@ -17,6 +20,32 @@ supabase_bucket = os.environ.get("SUPABASE_BUCKET")
 
 supabase = create_client(supabase_url, supabase_key)
 
+
+@st.cache_resource
+def get_upload_executor():
+    """Uploads of a submission run side by side on this pool."""
+    return ThreadPoolExecutor(max_workers=6, thread_name_prefix="intake-upload")
+
+
+@st.cache_resource
+def get_extraction_executor():
+    """Extraction runs here after the form has returned; shared by every session."""
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="intake-extract")
+
+
+def write_sidecar(folder_name, documents):
+    """Parse the uploaded documents and store the results as <folder>/extracted.json."""
+    try:
+        sidecar = build_sidecar(documents)
+        supabase.storage.from_(supabase_bucket).upload(
+            f"{folder_name}/{EXTRACTED_FILE}",
+            json.dumps(sidecar).encode("utf-8"),
+            {"content-type": "application/json", "upsert": "true"}
+        )
+    except Exception as e:
+        # The reviewer falls back to parsing the PDFs, so this only costs time later
+        print(f"Warning: could not write {folder_name}/{EXTRACTED_FILE}: {e}")
+
 st.set_page_config(page_title="Borrower Intake", layout="centered")
 st.title("📥 Borrower Income Submission")
 
@@ -53,24 +82,25 @@ if submitted:
                 "submitted_at": datetime.now().isoformat()
             }
             
-            # Upload metadata.json to Supabase
-            metadata_path = f"{folder_name}/metadata.json"
-            metadata_bytes = json.dumps(metadata, indent=2).encode('utf-8')
-            supabase.storage.from_(supabase_bucket).upload(
-                metadata_path,
-                metadata_bytes,
-                {"content-type": "application/json"}
-            )
-            
-            # Upload PDF files to Supabase
+            # Upload metadata.json and the PDF files to Supabase in parallel
+            uploads = [(f"{folder_name}/metadata.json", json.dumps(metadata, indent=2).encode('utf-8'), "application/json")]
+            documents = []
             for i, file in enumerate(uploaded_files):
-                file_path = f"{folder_name}/document_{i+1}.pdf"
+                file_name = f"document_{i+1}.pdf"
                 file_bytes = file.read()
-                supabase.storage.from_(supabase_bucket).upload(
-                    file_path,
-                    file_bytes,
-                    {"content-type": "application/pdf"}
-                )
+                documents.append((file_name, file_bytes))
+                uploads.append((f"{folder_name}/{file_name}", file_bytes, "application/pdf"))
+
+            bucket = supabase.storage.from_(supabase_bucket)
+            futures = [
+                get_upload_executor().submit(bucket.upload, path, data, {"content-type": content_type})
+                for path, data, content_type in uploads
+            ]
+            for future in futures:
+                future.result()
+
+            # Extract text and paystub fields in the background so the reviewer can skip parsing
+            get_extraction_executor().submit(write_sidecar, folder_name, documents)
             
             st.success(f"Thank you, {name}! Your information and documents have been uploaded to Supabase.")
             
@@ -38,4 +38,30 @@ def render_evaluation(result: dict, metadata: dict = None, document_list: list =
         st.divider()
         st.subheader("📄 Documents Evaluated")
         for doc in document_list:
-            st.markdown(f"- {doc.name}")
+            st.markdown(f"- {doc['name']}")
+
+
+# Extracted paystub fields shown while the model is still working, with their labels
+EXTRACTED_FIELD_LABELS = {
+    "employer_name": "Employer",
+    "pay_frequency": "Pay Frequency",
+    "pay_period_start": "Period Start",
+    "pay_period_end": "Period End",
+    "pay_date": "Pay Date",
+    "gross_pay_per_period": "Gross Pay",
+    "ytd_income": "YTD Income",
+    "net_pay": "Net Pay",
+    "hours": "Hours",
+    "rate": "Rate"
+}
+
+
+def render_extracted_fields(paystub_data: dict):
+    st.subheader("🔎 Extracted From the Paystub")
+    found = [(label, paystub_data.get(field)) for field, label in EXTRACTED_FIELD_LABELS.items() if paystub_data.get(field) is not None]
+    if not found:
+        st.info("No paystub fields found; the model will read the documents.")
+        return
+    cols = st.columns(2)
+    for i, (label, value) in enumerate(found):
+        cols[i % 2].markdown(f"**{label}:** {f'{value:,.2f}' if isinstance(value, float) else value}")